@@ -1,15 +1,20 @@
 from __future__ import annotations
 
 import asyncio
-import json
-from datetime import date, datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import lru_cache
 from typing import Any, AsyncGenerator, Optional
 
+import orjson
 import pandas as pd
 from fastapi import APIRouter, Query, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from backend.app.core.config import SETTINGS
 from backend.app.db.deps import DbDep, MarketCapDep, IndicatorsRepoDep
 from backend.app.repos.picks_repo import PicksRepo
 from backend.app.services.indicators import enrich_indicators
@@ -18,8 +23,31 @@ from backend.app.api.schemas import ApiResponse
 
 router = APIRouter(prefix="/api/v1", tags=["picks"])
 
+# 单页内并发处理股票的上限：防止一页 50 只股票同时打 DB/AkShare
+_SEM = asyncio.Semaphore(SETTINGS.picks_concurrency)
+
+# 进程内 bundle 缓存：同一 (rule, code, adjust, 窗口) 的重复请求直接命中，
+# 跳过 DB 查询 + 指标计算 + 序列化（翻页来回/前端刷新是最常见场景）。
+# OrderedDict 按插入序存放，时间戳随之单调；满容量时过期项必是队首前缀
+_BUNDLE_CACHE: OrderedDict[tuple, tuple[float, dict[str, Any]]] = OrderedDict()
+_BUNDLE_CACHE_MAX = 10_000
+
+# enrich_indicators 结果缓存（LRU）：同一交易日内 stream/非 stream 接口、重试
+# 会对完全相同的输入重复计算；key 用 (freq, code, adjust, 末行日期, 行数) 即可唯一确定输入。
+# _enrich_cached 跑在 asyncio.to_thread 的工作线程里，get/move_to_end 与
+# 另一线程的插入+淘汰会竞态（move_to_end 对刚被淘汰的 key 抛 KeyError），必须加锁
+_ENRICH_CACHE: OrderedDict[tuple, pd.DataFrame] = OrderedDict()
+_ENRICH_CACHE_MAX = 1024
+_ENRICH_CACHE_LOCK = threading.Lock()
+
+# 流式接口单次 yield 的目标块大小：Starlette 每次 yield 有固定调度开销，
+# 同步可得的小帧（meta/缓存命中）合并后一次推送
+_STREAM_CHUNK_BYTES = 64 * 1024
+
 
 class KlinePoint(BaseModel):
+    """K线单日记录的字段参照（仅作文档用途；响应里直接传 dict，避免逐行逐字段校验）。"""
+
     trade_date: str
     open: float | None = None
     high: float | None = None
@@ -50,8 +78,9 @@ class PickBundleItem(BaseModel):
     adjust: str
     market_cap: float | None = Field(default=None, description="总市值（元）")
     metrics: dict[str, Any] = Field(default_factory=dict)
-    daily: list[KlinePoint] = Field(default_factory=list)
-    weekly: list[KlinePoint] = Field(default_factory=list)
+    # 行记录来自 _df_to_records（可信来源）：声明为 dict，跳过 ~250 行 × 18 字段的逐点校验
+    daily: list[dict[str, Any]] = Field(default_factory=list)
+    weekly: list[dict[str, Any]] = Field(default_factory=list)
 
 
 class PicksBundle(BaseModel):
@@ -62,40 +91,52 @@ class PicksBundle(BaseModel):
     items: list[PickBundleItem]
 
 
-def _to_iso_date(d: Any) -> str:
-    if isinstance(d, (date, datetime)):
-        return d.strftime("%Y-%m-%d")
-    return str(d)
+# 只保留前端画图常用字段
+_RECORD_COLS: tuple[str, ...] = (
+    "trade_date",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "amount",
+    "amplitude",
+    "pct_change",
+    "change_amount",
+    "turnover_rate",
+    "macd_dif",
+    "macd_dea",
+    "macd_hist",
+    "kdj_k",
+    "kdj_d",
+    "kdj_j",
+    "short_trend_line",
+    "bull_bear_line",
+)
+
+# keep 列表按 DataFrame 列签名缓存：同构 frame（日K/周K）只算一次
+_KEEP_COLS_CACHE: dict[tuple[str, ...], list[str]] = {}
+
+
+def _keep_cols(columns) -> list[str]:
+    key = tuple(columns)
+    keep = _KEEP_COLS_CACHE.get(key)
+    if keep is None:
+        keep = [c for c in _RECORD_COLS if c in key]
+        _KEEP_COLS_CACHE[key] = keep
+    return keep
 
 
 def _df_to_records(df: pd.DataFrame) -> list[dict[str, Any]]:
-    # 只保留前端画图常用字段
-    cols = [
-        "trade_date",
-        "open",
-        "high",
-        "low",
-        "close",
-        "volume",
-        "amount",
-        "amplitude",
-        "pct_change",
-        "change_amount",
-        "turnover_rate",
-        "macd_dif",
-        "macd_dea",
-        "macd_hist",
-        "kdj_k",
-        "kdj_d",
-        "kdj_j",
-        "short_trend_line",
-        "bull_bear_line",
-    ]
-    keep = [c for c in cols if c in df.columns]
-    out = df[keep].copy()
-    out["trade_date"] = out["trade_date"].apply(_to_iso_date)
-    # pandas/numpy 类型转 Python 原生
-    return json.loads(out.to_json(orient="records"))
+    if df.empty:
+        return []
+    keep = _keep_cols(df.columns)
+    # 单次取出 object 矩阵：NaN -> None 一把写完，tolist() 在 C 层转 Python 原生标量
+    vals = df[keep].to_numpy(dtype=object)
+    vals[pd.isna(vals)] = None
+    # trade_date 由 repo 层保证为 datetime64，直接向量化格式化
+    vals[:, keep.index("trade_date")] = df["trade_date"].dt.strftime("%Y-%m-%d").to_numpy()
+    return [dict(zip(keep, row)) for row in vals.tolist()]
 
 
 _INDICATOR_COLS = [
@@ -110,19 +151,168 @@ _INDICATOR_COLS = [
 ]
 
 
-def _missing_indicator_trade_dates(df: pd.DataFrame) -> set:
+def _missing_indicator_mask(df: pd.DataFrame) -> Optional[pd.Series]:
     """
     更精确的缺失判断：逐行检查指标列。
     - indicators LEFT JOIN 结果中，如果某天指标行缺失或任一指标字段为 NULL，则该天需要回填
-    返回：需要回填的 trade_date 集合
+    返回：需要回填的行布尔掩码（与 df 行序对齐）；None 表示无需回填。
+    掩码直接用于回填后的切片，省掉构建 trade_date 集合 + isin 重新哈希整个窗口。
     """
     if df.empty or "trade_date" not in df.columns:
-        return set()
+        return None
     cols = [c for c in _INDICATOR_COLS if c in df.columns]
     if not cols:
-        return set(df["trade_date"].tolist())
+        return pd.Series(True, index=df.index)
+    # 快路径：最新一行指标完整 => 回填已跑过（指标按日整批写入），跳过全窗口扫描
+    if df[cols].iloc[-1].notna().all():
+        return None
     mask = df[cols].isna().any(axis=1)
-    return set(df.loc[mask, "trade_date"].tolist())
+    return mask if mask.any() else None
+
+
+@lru_cache(maxsize=1024)
+def _parse_trade_date(s: str) -> date:
+    """
+    解析路径参数 trade_date：YYYYMMDD（8位）或 YYYY-MM-DD。
+    直接按切片取数，比 strptime（每次重新解析格式串）快一个量级；
+    热门交易日反复请求时 lru_cache 直接命中。
+    """
+    if len(s) == 8:
+        return date(int(s[:4]), int(s[4:6]), int(s[6:8]))
+    return date(int(s[:4]), int(s[5:7]), int(s[8:10]))
+
+
+def _enrich_cached(freq: str, code: str, adjust: str, base: pd.DataFrame) -> pd.DataFrame:
+    key = (freq, code, adjust, str(base["trade_date"].iloc[-1]), len(base))
+    with _ENRICH_CACHE_LOCK:
+        hit = _ENRICH_CACHE.get(key)
+        if hit is not None:
+            _ENRICH_CACHE.move_to_end(key)
+            return hit
+    # 计算放在锁外：enrich 可能上百毫秒，别让其它线程的缓存命中陪着等
+    out = enrich_indicators(base)
+    with _ENRICH_CACHE_LOCK:
+        _ENRICH_CACHE[key] = out
+        if len(_ENRICH_CACHE) > _ENRICH_CACHE_MAX:
+            _ENRICH_CACHE.popitem(last=False)
+    return out
+
+
+async def _prefetch_page(
+    picks,
+    *,
+    rule_name: str,
+    td: Any,
+    start: Any,
+    adjust: str,
+    market_cap,
+    indicators_repo,
+) -> tuple[dict[str, dict[str, Any]], dict[str, Any], dict[str, pd.DataFrame], dict[str, pd.DataFrame]]:
+    """
+    整页预取：先查进程内 bundle 缓存，未命中的 code 合并为
+    市值 1 次 + 日K 1 次 + 周K 1 次，共 3 个批量查询（并发发出）。
+    返回 (cached_items, caps, daily_map, weekly_map)，后三者只含未命中 code。
+    """
+    ttl = SETTINGS.picks_cache_ttl_seconds
+    now = time.monotonic()
+    cached: dict[str, dict[str, Any]] = {}
+    pending = []
+    for p in picks:
+        hit = _BUNDLE_CACHE.get((rule_name, p.code, adjust, start, td))
+        if hit is not None and (now - hit[0] <= ttl):
+            cached[p.code] = hit[1]
+        else:
+            pending.append(p)
+
+    if not pending:
+        return cached, {}, {}, {}
+
+    async def load_weekly_safe(codes):
+        try:
+            return await indicators_repo.load_weekly_join_many(codes, start, td, adjust)
+        except Exception:
+            # 周K可能还未入库；不中断整个接口
+            return {}
+
+    codes = [p.code for p in pending]
+    caps, daily_map, weekly_map = await asyncio.gather(
+        market_cap.get_market_caps(codes),
+        indicators_repo.load_daily_join_many(codes, start, td, adjust),
+        load_weekly_safe(codes),
+    )
+    return cached, caps, daily_map, weekly_map
+
+
+async def _build_bundle_item(
+    p,
+    *,
+    rule_name: str,
+    td: Any,
+    start: Any,
+    adjust: str,
+    cap: Any,
+    df_d0: pd.DataFrame,
+    df_w0: pd.DataFrame,
+    indicators_repo,
+) -> dict[str, Any]:
+    """
+    组装单只股票的 bundle（K线数据已由 _prefetch_page 批量取回）：
+    指标缺失时现算并回填。两个 picks 接口（JSON / NDJSON 流式）共用；
+    并发由 _SEM 统一限流，结果写入进程内 TTL 缓存。
+    """
+    ttl = SETTINGS.picks_cache_ttl_seconds
+    key = (rule_name, p.code, adjust, start, td)
+
+    async with _SEM:
+        # 精确缺失判断：只回填缺失的交易日（但计算仍需全窗口，保证递推指标正确）
+        mask_d = _missing_indicator_mask(df_d0)
+        if mask_d is not None:
+            # 列选择已产生新 frame，且 enrich_indicators 不改写输入；切片仅供 itertuples 读取，
+            # 均无需额外 .copy()
+            base = df_d0[["trade_date", "open", "high", "low", "close", "volume", "amount"]]
+            # pandas/NumPy 计算放到线程池，避免阻塞 event loop（影响其它并发股票的 I/O）
+            df_d = await asyncio.to_thread(_enrich_cached, "D", p.code, adjust, base)
+            # enrich 会 reset_index，掩码按位置复用（行序不变：SQL 已按 trade_date 排序）
+            await indicators_repo.upsert_daily(p.code, adjust, df_d.loc[mask_d.to_numpy()])
+        else:
+            df_d = df_d0
+        try:
+            mask_w = _missing_indicator_mask(df_w0)
+            if mask_w is not None:
+                base = df_w0[["trade_date", "open", "high", "low", "close", "volume", "amount"]]
+                df_w = await asyncio.to_thread(_enrich_cached, "W", p.code, adjust, base)
+                await indicators_repo.upsert_weekly(p.code, adjust, df_w.loc[mask_w.to_numpy()])
+            else:
+                df_w = df_w0
+        except Exception:
+            # 周K可能还未入库；不中断整个接口
+            df_w = pd.DataFrame(columns=["trade_date", "open", "high", "low", "close", "volume", "amount"])
+
+        item = {
+            "code": p.code,
+            "name": p.name,
+            "exchange": p.exchange,
+            "trade_date": td.strftime("%Y-%m-%d"),
+            "rule_name": rule_name,
+            "adjust": adjust,
+            "market_cap": cap,  # 元
+            "metrics": p.metrics or {},
+            "daily": _df_to_records(df_d),
+            "weekly": _df_to_records(df_w),
+        }
+
+        # 写缓存；超容量时先从队首弹掉过期项（时间戳随插入序单调，过期项
+        # 必是前缀），一条都没过期则按最旧淘汰，保证容量有界且均摊 O(1)。
+        # 重写同 key 前先 pop 再插尾，维持时间戳单调
+        if len(_BUNDLE_CACHE) >= _BUNDLE_CACHE_MAX:
+            cutoff = time.monotonic() - ttl
+            while _BUNDLE_CACHE and next(iter(_BUNDLE_CACHE.values()))[0] < cutoff:
+                _BUNDLE_CACHE.popitem(last=False)
+            while len(_BUNDLE_CACHE) >= _BUNDLE_CACHE_MAX:
+                _BUNDLE_CACHE.popitem(last=False)
+        _BUNDLE_CACHE.pop(key, None)
+        _BUNDLE_CACHE[key] = (time.monotonic(), item)
+        return item
 
 
 @router.get("/picks/{rule_name}/{trade_date}", response_model=ApiResponse[PicksBundle])
@@ -146,10 +336,7 @@ async def get_picks_bundle(
     - 市值查询：AkShare + 并发限流 + TTL 缓存
     - K线与指标：每只股票独立处理；如需流式返回请调用 /stream 接口
     """
-    try:
-        td = datetime.strptime(trade_date, "%Y%m%d").date()
-    except ValueError:
-        td = datetime.strptime(trade_date, "%Y-%m-%d").date()
+    td = _parse_trade_date(trade_date)
 
     picks_repo = PicksRepo(db)
 
@@ -165,60 +352,47 @@ async def get_picks_bundle(
 
     start = td - timedelta(days=window_days)
 
-    async def build_one(p):
-        cap_task = asyncio.create_task(market_cap.get_market_cap(p.code))
-        daily_task = asyncio.create_task(indicators_repo.load_daily_join(p.code, start, td, adjust))
-        weekly_task = asyncio.create_task(indicators_repo.load_weekly_join(p.code, start, td, adjust))
-
-        cap = await cap_task
-        df_d0 = await daily_task
-        # 精确缺失判断：只回填缺失的交易日（但计算仍需全窗口，保证递推指标正确）
-        missing_dates_d = _missing_indicator_trade_dates(df_d0)
-        if (not df_d0.empty) and missing_dates_d:
-            base = df_d0[["trade_date", "open", "high", "low", "close", "volume", "amount"]].copy()
-            df_d = enrich_indicators(base)
-            await indicators_repo.upsert_daily(p.code, adjust, df_d[df_d["trade_date"].isin(missing_dates_d)].copy())
-        else:
-            df_d = df_d0
-        try:
-            df_w0 = await weekly_task
-            missing_dates_w = _missing_indicator_trade_dates(df_w0)
-            if (not df_w0.empty) and missing_dates_w:
-                base = df_w0[["trade_date", "open", "high", "low", "close", "volume", "amount"]].copy()
-                df_w = enrich_indicators(base)
-                await indicators_repo.upsert_weekly(p.code, adjust, df_w[df_w["trade_date"].isin(missing_dates_w)].copy())
-            else:
-                df_w = df_w0
-        except Exception:
-            # 周K可能还未入库；不中断整个接口
-            df_w = pd.DataFrame(columns=["trade_date", "open", "high", "low", "close", "volume", "amount"])
-
-        return {
-            "code": p.code,
-            "name": p.name,
-            "exchange": p.exchange,
-            "trade_date": td.strftime("%Y-%m-%d"),
-            "rule_name": rule_name,
-            "adjust": adjust,
-            "market_cap": cap,  # 元
-            "metrics": p.metrics or {},
-            "daily": _df_to_records(df_d),
-            "weekly": _df_to_records(df_w),
-        }
-
-    # 非流式：顺序聚合，避免一次性并发过大
-    items = []
-    for p in picks:
-        items.append(await build_one(p))
+    # 整页预取（3 次批量查询）后并发组装（_SEM 限流），最终按 picks 原始顺序返回
+    cached, caps, daily_map, weekly_map = await _prefetch_page(
+        picks,
+        rule_name=rule_name,
+        td=td,
+        start=start,
+        adjust=adjust,
+        market_cap=market_cap,
+        indicators_repo=indicators_repo,
+    )
+    pending = [p for p in picks if p.code not in cached]
+    built = await asyncio.gather(
+        *(
+            _build_bundle_item(
+                p,
+                rule_name=rule_name,
+                td=td,
+                start=start,
+                adjust=adjust,
+                cap=caps.get(p.code),
+                df_d0=daily_map.get(p.code, pd.DataFrame()),
+                df_w0=weekly_map.get(p.code, pd.DataFrame()),
+                indicators_repo=indicators_repo,
+            )
+            for p in pending
+        )
+    )
+    by_code = {p.code: item for p, item in zip(pending, built)}
+    items = [cached[p.code] if p.code in cached else by_code[p.code] for p in picks]
 
-    bundle = PicksBundle(
+    # item dict 由 _df_to_records 内部产出、类型可信：model_construct 跳过逐字段校验
+    bundle = PicksBundle.model_construct(
         rule_name=rule_name,
         trade_date=td.strftime("%Y-%m-%d"),
         next_cursor=next_cursor,
         total=total,
-        items=[PickBundleItem(**x) for x in items],
+        items=[PickBundleItem.model_construct(**x) for x in items],
+    )
+    return ApiResponse[PicksBundle].model_construct(
+        request_id=getattr(request.state, "request_id", None), data=bundle
     )
-    return ApiResponse[PicksBundle](request_id=getattr(request.state, "request_id", None), data=bundle)
 
 
 @router.get("/picks/{rule_name}/{trade_date}/stream")
@@ -239,10 +413,7 @@ async def get_picks_bundle_stream(
     - 第一条为 meta：包含 request_id / next_cursor 等
     - 后续多条为 item：每只股票一条（可边拉边画）
     """
-    try:
-        td = datetime.strptime(trade_date, "%Y%m%d").date()
-    except ValueError:
-        td = datetime.strptime(trade_date, "%Y-%m-%d").date()
+    td = _parse_trade_date(trade_date)
 
     picks_repo = PicksRepo(db)
     try:
@@ -256,45 +427,6 @@ async def get_picks_bundle_stream(
 
     start = td - timedelta(days=window_days)
 
-    async def build_one(p):
-        cap_task = asyncio.create_task(market_cap.get_market_cap(p.code))
-        daily_task = asyncio.create_task(indicators_repo.load_daily_join(p.code, start, td, adjust))
-        weekly_task = asyncio.create_task(indicators_repo.load_weekly_join(p.code, start, td, adjust))
-
-        cap = await cap_task
-        df_d0 = await daily_task
-        missing_dates_d = _missing_indicator_trade_dates(df_d0)
-        if (not df_d0.empty) and missing_dates_d:
-            base = df_d0[["trade_date", "open", "high", "low", "close", "volume", "amount"]].copy()
-            df_d = enrich_indicators(base)
-            await indicators_repo.upsert_daily(p.code, adjust, df_d[df_d["trade_date"].isin(missing_dates_d)].copy())
-        else:
-            df_d = df_d0
-        try:
-            df_w0 = await weekly_task
-            missing_dates_w = _missing_indicator_trade_dates(df_w0)
-            if (not df_w0.empty) and missing_dates_w:
-                base = df_w0[["trade_date", "open", "high", "low", "close", "volume", "amount"]].copy()
-                df_w = enrich_indicators(base)
-                await indicators_repo.upsert_weekly(p.code, adjust, df_w[df_w["trade_date"].isin(missing_dates_w)].copy())
-            else:
-                df_w = df_w0
-        except Exception:
-            df_w = pd.DataFrame(columns=["trade_date", "open", "high", "low", "close", "volume", "amount"])
-
-        return {
-            "code": p.code,
-            "name": p.name,
-            "exchange": p.exchange,
-            "trade_date": td.strftime("%Y-%m-%d"),
-            "rule_name": rule_name,
-            "adjust": adjust,
-            "market_cap": cap,
-            "metrics": p.metrics or {},
-            "daily": _df_to_records(df_d),
-            "weekly": _df_to_records(df_w),
-        }
-
     async def gen() -> AsyncGenerator[bytes, None]:
         header = {
             "rule_name": rule_name,
@@ -303,11 +435,59 @@ async def get_picks_bundle_stream(
             "total": total,
             "request_id": getattr(request.state, "request_id", None),
         }
-        yield (json.dumps({"type": "meta", "data": header}, ensure_ascii=False) + "\n").encode("utf-8")
-        tasks = [asyncio.create_task(build_one(p)) for p in picks]
-        for coro in asyncio.as_completed(tasks):
-            item = await coro
-            yield (json.dumps({"type": "item", "data": item}, ensure_ascii=False) + "\n").encode("utf-8")
-
-    return StreamingResponse(gen(), media_type="application/x-ndjson")
+        # orjson 直接产出 UTF-8 bytes，比 stdlib json.dumps + encode 快数倍
+        buf = bytearray(orjson.dumps({"type": "meta", "data": header}) + b"\n")
+
+        cached, caps, daily_map, weekly_map = await _prefetch_page(
+            picks,
+            rule_name=rule_name,
+            td=td,
+            start=start,
+            adjust=adjust,
+            market_cap=market_cap,
+            indicators_repo=indicators_repo,
+        )
+        # 缓存命中的先推（零成本）；与 meta 合并成大块，减少 per-yield 开销
+        for item in cached.values():
+            buf += orjson.dumps({"type": "item", "data": item}) + b"\n"
+            if len(buf) >= _STREAM_CHUNK_BYTES:
+                yield bytes(buf)
+                buf.clear()
+        if buf:
+            yield bytes(buf)
+
+        # 其余并发组装、谁先好推谁。生产者/队列模式：O(N) 调度，避免 as_completed 每轮重建 future/回调
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce(p) -> None:
+            try:
+                queue.put_nowait(
+                    await _build_bundle_item(
+                        p,
+                        rule_name=rule_name,
+                        td=td,
+                        start=start,
+                        adjust=adjust,
+                        cap=caps.get(p.code),
+                        df_d0=daily_map.get(p.code, pd.DataFrame()),
+                        df_w0=weekly_map.get(p.code, pd.DataFrame()),
+                        indicators_repo=indicators_repo,
+                    )
+                )
+            except Exception as e:  # 异常经队列回传，由消费侧抛出
+                queue.put_nowait(e)
+
+        tasks = [asyncio.create_task(produce(p)) for p in picks if p.code not in cached]
+        for _ in range(len(tasks)):
+            item = await queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield orjson.dumps({"type": "item", "data": item}) + b"\n"
+
+    return StreamingResponse(
+        gen(),
+        media_type="application/x-ndjson",
+        # 禁止 nginx 等反代重新缓冲，保证边拉边画
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-store"},
+    )
 
@@ -1,12 +1,41 @@
 from __future__ import annotations
 
-from typing import Annotated
+from dataclasses import make_dataclass
+from functools import lru_cache
+from typing import Annotated, Any
 
 import getpass
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
 
 
+@lru_cache(maxsize=64)
+def _split_list_str(s: str) -> tuple[str, ...]:
+    s = s.strip()
+    if s == "":
+        return ()
+    if s == "*":
+        return ("*",)
+    return tuple(x.strip() for x in s.split(",") if x.strip())
+
+
+def _parse_list(v: Any) -> Any:
+    """
+    列表型配置的统一解析（allowed_hosts / cors_* / strategies 共用）：
+    - JSON 数组（'[...]'）：原样返回，交由 pydantic 解码
+    - 逗号分隔字符串 / '*'：拆分（lru_cache 记住相同环境变量的解析结果）
+    """
+    if v is None:
+        return v
+    if isinstance(v, list):
+        return [str(x).strip() for x in v if str(x).strip()]
+    if isinstance(v, str):
+        if v.strip().startswith("["):
+            return v
+        return list(_split_list_str(v))
+    return v
+
+
 class Settings(BaseSettings):
     """
     线上风格配置：全部来自环境变量，默认值尽量安全。
@@ -68,74 +97,47 @@ class Settings(BaseSettings):
     scheduler_misfire_grace_seconds: int = Field(default=60 * 30, description="错过触发后的最大补跑窗口（秒）")
     scheduler_run_on_start: bool = Field(default=False, description="worker 启动时立刻跑一次（用于验证/补数据）")
 
+    # 流水线默认在进程内（线程池）调用 ops 脚本入口，省去每阶段一次的
+    # 解释器启动与 akshare/pandas 重复 import；置 true 回退子进程隔离执行
+    pipeline_use_subprocess: bool = Field(default=False, description="流水线阶段是否用子进程执行 ops 脚本")
+    # 选股阶段并发度；0 表示按 CPU 数自适应（min(4, cpu_count)）
+    pipeline_pick_concurrency: int = Field(default=0, ge=0, le=16, description="选股策略并发执行数")
+
+    # 进程本地文件缓存（交易日历等小文件）
+    cache_dir: str = Field(default="backend/cache", description="本地缓存目录（相对或绝对路径）")
+    trade_cal_ttl_seconds: int = Field(default=86400, description="交易日历磁盘缓存 TTL（秒）")
+
+    # ---------- API ----------
+    # picks 接口内单页并发处理的股票数上限（DB + AkShare 并发保护）
+    picks_concurrency: int = Field(default=8, ge=1, le=64, description="picks 接口每页并发处理股票数")
+    picks_cache_ttl_seconds: int = Field(default=3600, description="picks bundle 进程内缓存 TTL（秒）")
+
     # 策略列表：逗号分隔（或 JSON 数组），例如 HQ_STRATEGIES="b1,b2"
     strategies: Annotated[list[str], NoDecode] = Field(default_factory=lambda: ["b1,b2"])
 
-    @field_validator("strategies", mode="before")
-    @classmethod
-    def _parse_strategies(cls, v):
-        if v is None:
-            return v
-        if isinstance(v, list):
-            return [str(x).strip() for x in v if str(x).strip()]
-        if isinstance(v, str):
-            s = v.strip()
-            if s == "":
-                return []
-            if s.startswith("["):
-                # 允许 JSON 数组：交由 pydantic 解码
-                return v
-            return [x.strip() for x in s.split(",") if x.strip()]
-        return v
+    # 跳过请求计时/request-id 头写入的路径（健康检查等高频探活请求）
+    skip_timing_paths: Annotated[list[str], NoDecode] = Field(
+        default_factory=lambda: ["/healthz", "/api/v1/healthz"]
+    )
 
-    @field_validator("allowed_hosts", mode="before")
+    @field_validator(
+        "allowed_hosts",
+        "cors_allow_origins",
+        "cors_allow_methods",
+        "cors_allow_headers",
+        "strategies",
+        "skip_timing_paths",
+        mode="before",
+    )
     @classmethod
-    def _parse_allowed_hosts(cls, v):
+    def _parse_list_fields(cls, v):
         """
-        允许使用两种方式配置：
+        允许使用两种方式配置（以 HQ_ALLOWED_HOSTS 为例）：
         - HQ_ALLOWED_HOSTS='["example.com","api.example.com"]'  (JSON)
         - HQ_ALLOWED_HOSTS='example.com,api.example.com'        (逗号分隔)
-        - HQ_ALLOWED_HOSTS='*'                                  (允许任意 Host，不建议线上使用)
-        """
-        if v is None:
-            return v
-        if isinstance(v, list):
-            return v
-        if isinstance(v, str):
-            s = v.strip()
-            if s == "":
-                return []
-            if s == "*":
-                return ["*"]
-            # JSON 形式交给 pydantic 自己 decode 也可，但这里做兼容
-            if s.startswith("["):
-                return v
-            return [x.strip() for x in s.split(",") if x.strip()]
-        return v
-
-    @field_validator("cors_allow_origins", "cors_allow_methods", "cors_allow_headers", mode="before")
-    @classmethod
-    def _parse_cors_list(cls, v):
+        - HQ_ALLOWED_HOSTS='*'                                  (允许任意值；线上慎用)
         """
-        允许使用两种方式配置：
-        - HQ_CORS_ALLOW_ORIGINS='["http://a.com","http://b.com"]'  (JSON)
-        - HQ_CORS_ALLOW_ORIGINS='http://a.com,http://b.com'        (逗号分隔)
-        - HQ_CORS_ALLOW_ORIGINS='*'                                (允许任意 Origin；若如此则 credentials 必须为 false)
-        """
-        if v is None:
-            return v
-        if isinstance(v, list):
-            return [str(x).strip() for x in v if str(x).strip()]
-        if isinstance(v, str):
-            s = v.strip()
-            if s == "":
-                return []
-            if s == "*":
-                return ["*"]
-            if s.startswith("["):
-                return v
-            return [x.strip() for x in s.split(",") if x.strip()]
-        return v
+        return _parse_list(v)
 
     @field_validator("cors_allow_credentials")
     @classmethod
@@ -147,5 +149,31 @@ class Settings(BaseSettings):
         return v
 
 
-settings = Settings()
+# 常见取值提前喂进解析缓存，首个请求不用付 split 成本
+_split_list_str("")
+_split_list_str("*")
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    缓存的 Settings 工厂：env 解析与校验只跑一次；
+    测试里可用 get_settings.cache_clear() 重置后再改环境变量。
+    """
+    return Settings()
+
+
+settings = get_settings()
+
+# 启动时把校验后的配置冻结成 slots dataclass 快照：热路径上属性访问是
+# C 层 slot 读取，绕开 pydantic 模型的描述符开销。字段列表取自
+# Settings.model_fields，新增配置项无需在这里重复声明。
+# 热路径（jobs/middleware/api）用 SETTINGS；settings 保留给调试/管理端。
+RuntimeSettings = make_dataclass(
+    "RuntimeSettings",
+    [(name, Any) for name in Settings.model_fields],
+    frozen=True,
+    slots=True,
+)
+SETTINGS = RuntimeSettings(**settings.model_dump())
 
@@ -1,38 +1,85 @@
 from __future__ import annotations
 
+import atexit
 import logging
 import os
+import queue
+import socket
 import sys
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
 from typing import Optional
 
+import orjson
 
-class _IncludePrefixFilter(logging.Filter):
-    def __init__(self, prefixes: tuple[str, ...]):
-        super().__init__()
-        self.prefixes = prefixes
+# 进程级常量只取一次，避免每条日志各来一次 syscall
+_HOSTNAME = socket.gethostname()
+_PID = os.getpid()
 
-    def filter(self, record: logging.LogRecord) -> bool:  # noqa: A003 (filter)
-        return record.name.startswith(self.prefixes)
 
+class _PrefixRouter(logging.Filter):
+    """
+    listener 侧按 logger 名分流（include=False 为排除）。
+    跑在后台日志线程上，不在请求路径；名字有限且反复出现，按名缓存判定。
+    """
 
-class _ExcludePrefixFilter(logging.Filter):
-    def __init__(self, prefixes: tuple[str, ...]):
+    def __init__(self, prefixes: tuple[str, ...], include: bool = True):
         super().__init__()
         self.prefixes = prefixes
+        self.include = include
+        self._cache: dict[str, bool] = {}
 
     def filter(self, record: logging.LogRecord) -> bool:  # noqa: A003 (filter)
-        return not record.name.startswith(self.prefixes)
+        res = self._cache.get(record.name)
+        if res is None:
+            res = record.name.startswith(self.prefixes) == self.include
+            self._cache[record.name] = res
+        return res
 
 
 def _fmt() -> logging.Formatter:
     return logging.Formatter(
-        fmt="%(asctime)s %(levelname)s %(name)s %(message)s",
+        fmt="%(asctime)s %(levelname)s %(name)s [%(pid)s@%(hostname)s] %(message)s",
         datefmt="%Y-%m-%dT%H:%M:%S%z",
     )
 
 
+# Formatter 无状态，所有 handler 共享同一个实例即可
+_FORMATTER = _fmt()
+
+
+class _JsonFormatter(logging.Formatter):
+    """
+    JSON 行格式（给 access.log 这类高频、机器消费的流）：
+    orjson 在 C 层序列化，绕开 %-格式化和 asctime 的 strftime；
+    时间戳直接用 record.created（epoch 秒），解析方自行格式化。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:  # noqa: A003 (format)
+        return orjson.dumps(
+            {
+                "ts": record.created,
+                "lvl": record.levelname,
+                "name": record.name,
+                "pid": _PID,
+                "host": _HOSTNAME,
+                "msg": record.getMessage(),
+            }
+        ).decode()
+
+
+_JSON_FORMATTER = _JsonFormatter()
+
+_base_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs) -> logging.LogRecord:
+    record = _base_record_factory(*args, **kwargs)
+    record.hostname = _HOSTNAME
+    record.pid = _PID
+    return record
+
+
 class _SafeTimedRotatingFileHandler(TimedRotatingFileHandler):
     """
     TimedRotatingFileHandler 在滚动/清理旧文件时会 os.listdir(日志目录)；
@@ -63,7 +110,9 @@ class _SafeTimedRotatingFileHandler(TimedRotatingFileHandler):
             super().doRollover()
 
 
-def _file_handler(path: Path, level: int, retention_days: int) -> TimedRotatingFileHandler:
+def _file_handler(
+    path: Path, level: int, retention_days: int, formatter: logging.Formatter = _FORMATTER
+) -> logging.Handler:
     # 按天滚动；backupCount=保留天数（自动清理旧文件）
     path.parent.mkdir(parents=True, exist_ok=True)
     h = _SafeTimedRotatingFileHandler(
@@ -76,8 +125,13 @@ def _file_handler(path: Path, level: int, retention_days: int) -> TimedRotatingF
         utc=False,
     )
     h.setLevel(level)
-    h.setFormatter(_fmt())
-    return h
+    h.setFormatter(formatter)
+    # 内存缓冲：攒一批再落盘（ERROR 及以上立即 flush），把每条一次的 write()
+    # syscall 合并成批量写；进程退出时 atexit 兜底 flush
+    mem = MemoryHandler(capacity=512, flushLevel=logging.ERROR, target=h, flushOnClose=True)
+    mem.setLevel(level)
+    atexit.register(mem.flush)
+    return mem
 
 
 def configure_logging(
@@ -97,15 +151,15 @@ def configure_logging(
         - access.log：HTTP access 日志（uvicorn.access）
         - error.log：ERROR+ 汇总
     """
+    global _LISTENER
     lvl = getattr(logging, level.upper(), logging.INFO)
+    logging.setLogRecordFactory(_record_factory)
     console = logging.StreamHandler(sys.stdout)
     console.setLevel(lvl)
-    console.setFormatter(_fmt())
+    console.setFormatter(_FORMATTER)
 
-    app_handler = None
-    jobs_handler = None
-    access_handler = None
-    error_handler = None
+    # listener 侧的落盘 handler：分流过滤跑在后台线程，不占请求路径
+    sinks: list[logging.Handler] = [console]
 
     if to_file:
         d = Path(log_dir).expanduser().resolve()
@@ -113,37 +167,38 @@ def configure_logging(
 
         app_handler = _file_handler(d / "app.log", lvl, retention_days)
         # app.log 不记录 access 与 jobs（避免重复、便于区分）
-        app_handler.addFilter(_ExcludePrefixFilter(("uvicorn.access", "backend.app.jobs", "backend.worker")))
+        app_handler.addFilter(_PrefixRouter(("uvicorn.access", "backend.app.jobs", "backend.worker"), include=False))
 
         jobs_handler = _file_handler(d / "jobs.log", lvl, retention_days)
-        jobs_handler.addFilter(_IncludePrefixFilter(("backend.app.jobs", "backend.worker")))
+        jobs_handler.addFilter(_PrefixRouter(("backend.app.jobs", "backend.worker")))
 
-        access_handler = _file_handler(d / "access.log", lvl, retention_days)
-        access_handler.addFilter(_IncludePrefixFilter(("uvicorn.access",)))
+        # access 量最大：JSON 行 + orjson，省掉每请求一次的 %-格式化/strftime
+        access_handler = _file_handler(d / "access.log", lvl, retention_days, formatter=_JSON_FORMATTER)
+        access_handler.addFilter(_PrefixRouter(("uvicorn.access",)))
 
         error_handler = _file_handler(d / "error.log", logging.ERROR, retention_days)
 
+        sinks += [app_handler, jobs_handler, access_handler, error_handler]
+
+    # 请求线程/event loop 只做一次 queue.put：格式化与磁盘 I/O 全部移交后台线程
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    qh = QueueHandler(q)
+
     # ---------- root ----------
     root = logging.getLogger()
     root.setLevel(lvl)
-    handlers = [console]
-    if app_handler:
-        handlers.append(app_handler)
-    if error_handler:
-        handlers.append(error_handler)
-    root.handlers = handlers
-
-    # ---------- uvicorn access: 独立到 access.log，避免写进 app.log ----------
+    root.handlers = [qh]
+
+    # ---------- uvicorn access / jobs: propagate=False，仍只投递到同一队列 ----------
     uv_access = logging.getLogger("uvicorn.access")
     uv_access.setLevel(lvl)
-    uv_access.handlers = [console] + ([access_handler] if access_handler else [])
+    uv_access.handlers = [qh]
     uv_access.propagate = False
 
-    # ---------- jobs: 独立到 jobs.log（同时写 error.log） ----------
     for name in ("backend.app.jobs", "backend.worker"):
         lg = logging.getLogger(name)
         lg.setLevel(lvl)
-        lg.handlers = [console] + ([jobs_handler] if jobs_handler else []) + ([error_handler] if error_handler else [])
+        lg.handlers = [qh]
         lg.propagate = False
 
     # ---------- uvicorn error: 交给 root（app/error） ----------
@@ -152,6 +207,29 @@ def configure_logging(
     uv_err.handlers = []
     uv_err.propagate = True
 
+    # 重新配置时先停掉旧 listener（flush 余量），再起新线程
+    if _LISTENER is not None:
+        _LISTENER.stop()
+    _LISTENER = QueueListener(q, *sinks, respect_handler_level=True)
+    _LISTENER.start()
+
+
+_LISTENER: Optional[QueueListener] = None
+
+
+def stop_logging_listener() -> None:
+    """停止后台日志线程并 flush 余量（lifespan 关闭时调用；幂等，atexit 兜底）。"""
+    global _LISTENER
+    if _LISTENER is None:
+        return
+    try:
+        _LISTENER.stop()
+    finally:
+        _LISTENER = None
+
+
+atexit.register(stop_logging_listener)
+
 
 def get_logger(name: Optional[str] = None) -> logging.Logger:
     return logging.getLogger(name or "horacequant")
@@ -1,24 +1,78 @@
 from __future__ import annotations
 
 import asyncio
+import importlib.util
+import logging
 import os
 import sys
+import time
+from collections import deque
 from datetime import date, timedelta
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping, Optional
 
-import akshare as ak
-import pandas as pd
+# akshare/pandas/numpy 延迟到日历函数内部再 import：二者合计 1~2s 的导入成本
+# 不再挂在 backend.app.main 的冷启动上（uvicorn --reload、不碰调度器的场景）。
+# requests 很轻且共享会话需要在 import 时安装，保持顶层。
+import requests
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
 from backend.app.core.logging import get_logger
-from backend.app.core.config import settings
+from backend.app.core.config import SETTINGS
 from backend.app.db.database import Database
 
 
 logger = get_logger(__name__)
 
+# 子进程环境快照：只保留脚本实际需要的变量（容器里完整 env 可能有几百项
+# 注入的 secrets/代理配置），快照小则 execve 拷贝也小；进程启动时过滤一次，
+# 之后每次 run_cmd 复用同一只读视图
+_NEEDED_ENV_PREFIXES = ("HQ_", "PG", "PATH", "PYTHON", "LANG", "LC_", "TZ", "TUSHARE")
+# 代理变量保留：akshare/tushare 在受限网络下依赖它们出网
+_NEEDED_ENV_KEYS = frozenset(
+    {"HOME", "USER", "VIRTUAL_ENV", "CONDA_PREFIX"}
+    | {k + s for k in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "NO_PROXY") for s in ("",)}
+    | {"http_proxy", "https_proxy", "all_proxy", "no_proxy"}
+)
+_SUBPROC_ENV = MappingProxyType(
+    {
+        k: v
+        for k, v in os.environ.items()
+        if k.startswith(_NEEDED_ENV_PREFIXES) or k in _NEEDED_ENV_KEYS
+    }
+)
+
+# 共享 HTTP 会话：akshare 的拉取大多直接走 requests.get/post，每次新建
+# Session + TCP/TLS 握手。把 requests.api.request 指到常驻 Session 上后，
+# 同一次流水线内的所有 akshare 调用复用连接池（keep-alive + DNS 缓存）。
+_HTTP_SESSION = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+_HTTP_SESSION.mount("https://", _HTTP_ADAPTER)
+_HTTP_SESSION.mount("http://", _HTTP_ADAPTER)
+
+
+def _shared_session_request(method, url, **kwargs):
+    return _HTTP_SESSION.request(method=method, url=url, **kwargs)
+
+
+def _install_shared_http_session() -> None:
+    # requests.api.get/post 在调用时查模块全局 request，替换后即全部生效；
+    # 自建 Session 的代码路径不受影响
+    requests.api.request = _shared_session_request
+
+
+_install_shared_http_session()
 
+
+@lru_cache(maxsize=1)
 def project_root() -> Path:
+    # 结果进程内不变：缓存后向上逐级 stat .git 的开销只付一次
     here = Path(__file__).resolve()
     for p in [here.parent] + list(here.parents):
         if (p / ".git").exists():
@@ -27,15 +81,50 @@ def project_root() -> Path:
     return Path.cwd()
 
 
+@lru_cache(maxsize=1)
 def backend_root() -> Path:
     return project_root() / "backend"
 
 
-async def run_cmd(args: list[str], cwd: Optional[Path] = None, env: Optional[dict[str, str]] = None) -> None:
+# 路径/解释器进程内不变：import 时解析一次，tick 里不再做 .git 向上查找与 Path 拼接
+_ROOT = project_root()
+_BROOT = backend_root()
+_PY = sys.executable
+_DAILY_SCRIPT = _BROOT / "ops" / "scripts" / "a_share_daily_to_postgres.py"
+_WEEKLY_SCRIPT = _BROOT / "ops" / "scripts" / "a_share_weekly_to_postgres.py"
+_PICKER_SCRIPT = _BROOT / "ops" / "scripts" / "stock_picker_tdx.py"
+_RULES_DIR = _BROOT / "rules"
+
+
+@lru_cache(maxsize=1)
+def _rule_files() -> dict[str, Path]:
+    """规则文件索引：一次 glob 建好 {策略名: 路径}，替代每策略一次 exists() stat。"""
+    return {p.stem: p for p in _RULES_DIR.glob("*.tdx")}
+
+
+async def _drain(stream: asyncio.StreamReader, level: int, tail: deque[str]) -> int:
+    """逐行消费子进程输出：内存只占一行，进度实时进日志而不是等进程退出。
+
+    返回行数，供成功路径只记规模而不拼接正文。
+    """
+    # 级别检查提到循环外：级别被调高时整条进度流只付 decode + tail 的成本
+    emit = logger.isEnabledFor(level)
+    n = 0
+    async for line in stream:
+        text = line.decode("utf-8", errors="replace").rstrip()
+        if text:
+            n += 1
+            if emit:
+                logger.log(level, "%s", text)
+            tail.append(text)
+    return n
+
+
+async def run_cmd(args: list[str], cwd: Optional[Path] = None, env: Optional[Mapping[str, str]] = None) -> None:
     """
-    运行外部脚本（用于复用现有 ops 脚本/选股逻辑），并记录 stdout/stderr。
+    运行外部脚本（用于复用现有 ops 脚本/选股逻辑），stdout/stderr 流式记录。
     """
-    cwd = cwd or project_root()
+    cwd = cwd or _ROOT
     proc = await asyncio.create_subprocess_exec(
         *args,
         cwd=str(cwd),
@@ -43,44 +132,177 @@ async def run_cmd(args: list[str], cwd: Optional[Path] = None, env: Optional[dic
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
     )
-    out_b, err_b = await proc.communicate()
-    out = out_b.decode("utf-8", errors="replace")
-    err = err_b.decode("utf-8", errors="replace")
-    if proc.returncode != 0:
-        logger.error("Command failed rc=%s args=%s\nstdout=%s\nstderr=%s", proc.returncode, args, out[-4000:], err[-4000:])
-        raise RuntimeError(f"Command failed: {args} rc={proc.returncode}")
-    if out.strip():
-        logger.info("Command ok args=%s stdout_tail=%s", args, out.strip()[-1000:])
-    if err.strip():
-        logger.warning("Command ok args=%s stderr_tail=%s", args, err.strip()[-1000:])
-
-
-def is_trade_day_cn(d: date) -> bool:
+    # 只留末尾若干行用于失败时的错误消息；完整输出已逐行进日志
+    out_tail: deque[str] = deque(maxlen=200)
+    err_tail: deque[str] = deque(maxlen=200)
+    # 正常进度行降到 DEBUG：INFO 级别下选股的海量进度输出不再逐条进日志子系统，
+    # 失败诊断信息仍通过 tail 保留在 ERROR 路径
+    out_lines, err_lines = await asyncio.gather(
+        _drain(proc.stdout, logging.DEBUG, out_tail),
+        _drain(proc.stderr, logging.WARNING, err_tail),
+    )
+    rc = await proc.wait()
+    if rc != 0:
+        # 失败时才拼接尾部行；成功路径全程不产生整体输出的字符串副本
+        logger.error(
+            "Command failed rc=%s args=%s\nstdout_tail=%s\nstderr_tail=%s",
+            rc,
+            args,
+            "\n".join(out_tail),
+            "\n".join(err_tail),
+        )
+        raise RuntimeError(f"Command failed: {args} rc={rc}")
+    logger.debug("Command ok args=%s stdout_lines=%d stderr_lines=%d", args, out_lines, err_lines)
+
+
+@lru_cache(maxsize=None)
+def _load_script_module(path_str: str):
+    """按文件路径加载 ops 脚本模块并缓存：重量级 import（akshare/pandas）只付一次。"""
+    path = Path(path_str)
+    spec = importlib.util.spec_from_file_location(f"_ops_{path.stem}", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+async def run_stage(script: Path, argv: list[str], *, env: Optional[Mapping[str, str]] = None) -> None:
     """
-    使用新浪交易日历判断（需要联网）。
+    执行一个流水线阶段。默认在进程内调用脚本的 main(argv)（线程池执行，
+    省去每阶段一次的解释器启动与重复 import）；
+    HQ_PIPELINE_USE_SUBPROCESS=true 时回退为子进程隔离执行。
     """
+    if SETTINGS.pipeline_use_subprocess:
+        await run_cmd([_PY, str(script), *argv], cwd=_ROOT, env=env)
+        return
+    mod = _load_script_module(str(script))
+    rc = await asyncio.to_thread(mod.main, argv)
+    if rc != 0:
+        raise RuntimeError(f"Stage failed: {script.name} rc={rc}")
+
+
+# 交易日历缓存：(缓存当天, 升序 datetime64[D] 数组)。日历按天更新即可，跨天自动失效重拉；
+# 同时落一份 CSV 到本地缓存目录，进程重启/网络故障时可回退旧数据。
+# 用 numpy 数组 + searchsorted 做成员测试：几千个装箱 date 对象的 set 约 6 倍内存，
+# 而 8 字节/元素的有序数组二分即可
+_CAL_CACHE: Optional[tuple[date, np.ndarray]] = None
+# 并发触发时只让一个协程去拉日历，其余等缓存
+_CAL_LOCK = asyncio.Lock()
+_CAL_PATH = Path(SETTINGS.cache_dir) / "trade_cal_cn.csv"
+
+
+def _cal_to_array(df: pd.DataFrame) -> np.ndarray:
+    import pandas as pd
+
+    # 部分环境下 trade_date 可能是 object/str，不能直接用 .dt
+    dt = pd.to_datetime(df["trade_date"], errors="coerce")
+    arr = dt.dropna().to_numpy().astype("datetime64[D]")
+    arr.sort()
+    return arr
+
+
+def _cal_contains(dates: np.ndarray, d: date) -> bool:
+    import numpy as np
+
+    target = np.datetime64(d, "D")
+    idx = int(dates.searchsorted(target))
+    return idx < dates.size and dates[idx] == target
+
+
+def _load_cal_file() -> Optional[np.ndarray]:
+    import pandas as pd
+
+    try:
+        if not _CAL_PATH.exists():
+            return None
+        df = pd.read_csv(_CAL_PATH)
+        if df.empty or "trade_date" not in df.columns:
+            return None
+        return _cal_to_array(df)
+    except Exception:
+        logger.exception("Trade calendar cache read failed. path=%s", _CAL_PATH)
+        return None
+
+
+def _cal_file_fresh() -> bool:
+    try:
+        return (time.time() - _CAL_PATH.stat().st_mtime) < int(SETTINGS.trade_cal_ttl_seconds)
+    except OSError:
+        return False
+
+
+async def _refresh_calendar() -> Optional[np.ndarray]:
+    """返回当前可用的日历集合：优先 TTL 内的磁盘缓存，其次网络，失败回退旧数据。"""
+    import akshare as ak
+
+    global _CAL_CACHE
+    today = date.today()
+    if _cal_file_fresh():
+        cal = await asyncio.to_thread(_load_cal_file)
+        if cal is not None and cal.size:
+            _CAL_CACHE = (today, cal)
+            return cal
     try:
-        df = ak.tool_trade_date_hist_sina()
+        df = await asyncio.to_thread(ak.tool_trade_date_hist_sina)
         if df is None or df.empty or "trade_date" not in df.columns:
-            logger.warning("Trade calendar empty/unexpected, assume trade day. date=%s", d)
-            return True
-        # 部分环境下 trade_date 可能是 object/str，不能直接用 .dt
-        dt = pd.to_datetime(df["trade_date"], errors="coerce")
-        cal = set(dt.dropna().dt.date.tolist())
-        return d in cal
+            raise ValueError("empty/unexpected trade calendar")
+        cal = _cal_to_array(df)
+        _CAL_CACHE = (today, cal)
+        try:
+            _CAL_PATH.parent.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(df.to_csv, _CAL_PATH, index=False)
+        except Exception:
+            logger.exception("Trade calendar cache write failed. path=%s", _CAL_PATH)
+        return cal
     except Exception:
-        # 日历拉取失败时，为避免“误跳过交易日”，默认按交易日处理（后续拉数为空也不会入库）
-        logger.exception("Trade calendar fetch failed, assume trade day. date=%s", d)
-        return True
+        # 网络/解析失败：宁可用旧日历也不要误判（旧日历对历史日期仍然正确）
+        logger.exception("Trade calendar fetch failed, falling back to stale cache.")
+        if _CAL_CACHE is not None:
+            return _CAL_CACHE[1]
+        stale = await asyncio.to_thread(_load_cal_file)
+        if stale is not None and stale.size:
+            _CAL_CACHE = (today, stale)
+        return stale
 
 
-async def try_acquire_advisory_lock(db: Database, lock_key: int) -> bool:
-    v = await db.fetchval("SELECT pg_try_advisory_lock($1);", lock_key)
-    return bool(v)
+async def is_trade_day_cn(d: date) -> bool:
+    """
+    使用新浪交易日历判断。热路径是有序 datetime64 数组上的二分查找；
+    日历每天最多刷新一次，akshare 同步拉取放线程池执行，不阻塞事件循环。
+    """
+    today = date.today()
+    cached = _CAL_CACHE
+    if cached is not None and cached[0] == today:
+        return _cal_contains(cached[1], d)
+    async with _CAL_LOCK:
+        cached = _CAL_CACHE
+        if cached is not None and cached[0] == today:
+            return _cal_contains(cached[1], d)
+        cal = await _refresh_calendar()
+        if cal is None or not cal.size:
+            # 完全拿不到日历时，为避免“误跳过交易日”，默认按交易日处理
+            logger.warning("No trade calendar available, assume trade day. date=%s", d)
+            return True
+        return _cal_contains(cal, d)
+
 
+# SQL 用模块常量保持字符串身份稳定，命中 asyncpg 每连接的 prepared 缓存
+_TRY_LOCK_SQL = "SELECT pg_try_advisory_lock($1);"
+_UNLOCK_SQL = "SELECT pg_advisory_unlock($1);"
 
-async def release_advisory_lock(db: Database, lock_key: int) -> None:
-    await db.fetchval("SELECT pg_advisory_unlock($1);", lock_key)
+# 运行记录：misfire 补跑/多实例重复触发时，成功过的日期只付一次索引探测，
+# 不再重复全量拉数
+_RUNS_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+  target_date DATE PRIMARY KEY,
+  finished_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  status      TEXT NOT NULL
+);
+"""
+_RUNS_CHECK_SQL = "SELECT 1 FROM pipeline_runs WHERE target_date = $1 AND status = 'ok';"
+_RUNS_MARK_SQL = """
+INSERT INTO pipeline_runs(target_date, status) VALUES($1, 'ok')
+ON CONFLICT (target_date) DO UPDATE SET status = 'ok', finished_at = NOW();
+"""
 
 
 async def run_daily_pipeline(db: Database, target_date: date, adjust: str = "qfq") -> None:
@@ -93,94 +315,116 @@ async def run_daily_pipeline(db: Database, target_date: date, adjust: str = "qfq
     # 用 advisory lock 防止重复执行（多实例/重复启动）
     # lock_key 只是“锁的名字”（数值形式），需要全局稳定且尽量避免与其它任务冲突。
     # 这里改为可配置：HQ_SCHEDULER_LOCK_KEY
-    lock_key = int(getattr(settings, "scheduler_lock_key", 42424242))
-    locked = await try_acquire_advisory_lock(db, lock_key)
-    if not locked:
-        logger.warning("Daily pipeline already running, skip. date=%s", target_date)
+    # advisory lock 是会话级的：加锁/解锁必须发生在同一条连接上，
+    # 否则经池路由到别的连接解锁会静默失败，锁会一直挂到连接回收。
+    lock_key = int(SETTINGS.scheduler_lock_key)
+    async with db.connection() as lock_conn:
+        # 锁语句在持有的连接上显式 prepare：加锁/解锁/重入都复用同一份服务器端计划
+        try_lock = await lock_conn.prepare(_TRY_LOCK_SQL)
+        unlock = await lock_conn.prepare(_UNLOCK_SQL)
+        locked = bool(await try_lock.fetchval(lock_key))
+        if not locked:
+            logger.warning("Daily pipeline already running, skip. date=%s", target_date)
+            return
+
+        try:
+            await db.execute(_RUNS_SCHEMA_SQL, conn=lock_conn)
+            if await db.fetchval(_RUNS_CHECK_SQL, target_date, conn=lock_conn):
+                logger.info("Daily pipeline already succeeded, skip. date=%s", target_date)
+                return
+            await _run_daily_pipeline_locked(db, target_date, adjust)
+        finally:
+            await unlock.fetchval(lock_key)
+
+
+async def _run_daily_pipeline_locked(db: Database, target_date: date, adjust: str) -> None:
+    if not await is_trade_day_cn(target_date):
+        logger.info("Not a trade day, skip pipeline. date=%s", target_date)
         return
 
-    try:
-        if not is_trade_day_cn(target_date):
-            logger.info("Not a trade day, skip pipeline. date=%s", target_date)
-            return
+    env = _SUBPROC_ENV
 
-        root = project_root()
-        broot = backend_root()
-        py = sys.executable
-        env = os.environ.copy()
+    # 拉数阶段组成一个小 DAG：日K/周K 互不依赖（不同数据源端点），并发执行；
+    # 选股依赖拉数结果，等 DAG 全部收尾后再跑
+    async def _stage_daily() -> None:
+        # 日K：拉取最近一周（含当天），用于自动对齐可能遗漏的数据
+        start_daily = (target_date - timedelta(days=7)).strftime("%Y%m%d")
+        await run_stage(
+            _DAILY_SCRIPT,
+            [
+                "--start-date",
+                start_daily,
+                "--end-date",
+                target_date.strftime("%Y%m%d"),
+                "--adjust",
+                adjust,
+            ],
+            env=env,
+        )
 
-        # 1) 日K：拉取最近两天（含当天），用于自动对齐可能遗漏的数据
-        try:
-            daily_script = broot / "ops" / "scripts" / "a_share_daily_to_postgres.py"
-            start_daily = (target_date - timedelta(days=7)).strftime("%Y%m%d")
-            await run_cmd(
+    # # 周K 目前停用；恢复时定义 _stage_weekly 并加入下方 gather 即可与日K 并行
+    # async def _stage_weekly() -> None:
+    #     start_weekly = (target_date - timedelta(days=30)).strftime("%Y%m%d")
+    #     await run_stage(
+    #         _WEEKLY_SCRIPT,
+    #         ["--start-date", start_weekly, "--end-date", target_date.strftime("%Y%m%d"), "--adjust", adjust],
+    #         env=env,
+    #     )
+
+    fetch_stages = [("daily", _stage_daily())]
+    fetch_results = await asyncio.gather(*(c for _, c in fetch_stages), return_exceptions=True)
+    for (stage_name, _), res in zip(fetch_stages, fetch_results):
+        if isinstance(res, BaseException):
+            logger.error("Stage 1/2: %s K-line sync failed. date=%s err=%s", stage_name, target_date, res)
+        else:
+            logger.info("Stage 1/2: %s K-line sync success. date=%s", stage_name, target_date)
+
+    # 选股：各策略相互独立（读同一份数据快照），并发执行，
+    # 总耗时从各策略之和降到最慢一个；Semaphore 限并发保护 DB/CPU
+    strategies = list(SETTINGS.strategies) or ["b1"]
+    sem = asyncio.Semaphore(int(SETTINGS.pipeline_pick_concurrency) or min(4, os.cpu_count() or 2))
+
+    async def _pick_one(strat: str, rule_path: Path) -> None:
+        async with sem:
+            await run_stage(
+                _PICKER_SCRIPT,
                 [
-                    py,
-                    str(daily_script),
-                    "--start-date",
-                    start_daily,
-                    "--end-date",
-                    target_date.strftime("%Y%m%d"),
-                    "--adjust",
-                    adjust,
+                    "--rule",
+                    str(rule_path),
+                    "--rule-name",
+                    strat,
+                    "--trade-date",
+                    target_date.strftime("%Y-%m-%d"),
                 ],
-                cwd=root,
                 env=env,
             )
-            logger.info("Stage 1/3: Daily K-line sync success (last 2 days). date=%s", target_date)
-        except Exception as e:
-            logger.error("Stage 1/3: Daily K-line sync failed. date=%s err=%s", target_date, e)
-
-        # # 2) 周K：只需要覆盖近 30 天以包含当周
-        # try:
-        #     weekly_script = broot / "ops" / "scripts" / "a_share_weekly_to_postgres.py"
-        #     start_weekly = (target_date - timedelta(days=30)).strftime("%Y%m%d")
-        #     await run_cmd(
-        #         [
-        #             py,
-        #             str(weekly_script),
-        #             "--start-date",
-        #             start_weekly,
-        #             "--end-date",
-        #             target_date.strftime("%Y%m%d"),
-        #             "--adjust",
-        #             adjust,
-        #         ],
-        #         cwd=root,
-        #         env=env,
-        #     )
-        #     logger.info("Stage 2/3: Weekly K-line sync success. date=%s", target_date)
-        # except Exception as e:
-        #     logger.error("Stage 2/3: Weekly K-line sync failed. date=%s err=%s", target_date, e)
-
-        # 3) 选股：遍历策略列表
-        picker_script = broot / "ops" / "scripts" / "stock_picker_tdx.py"
-        strategies = list(getattr(settings, "strategies", ["b1"])) or ["b1"]
-        for strat in strategies:
-            try:
-                rule_path = broot / "rules" / f"{strat}.tdx"
-                if not rule_path.exists():
-                    logger.warning("Strategy rule file not found, skip. strategy=%s path=%s", strat, rule_path)
-                    continue
-                await run_cmd(
-                    [
-                        py,
-                        str(picker_script),
-                        "--rule",
-                        str(rule_path),
-                        "--rule-name",
-                        strat,
-                        "--trade-date",
-                        target_date.strftime("%Y-%m-%d"),
-                    ],
-                    cwd=root,
-                    env=env,
-                )
-                logger.info("Stage 3/3: Stock picking success. strategy=%s date=%s", strat, target_date)
-            except Exception as e:
-                logger.error("Stage 3/3: Stock picking failed. strategy=%s date=%s err=%s", strat, target_date, e)
-
-        logger.info("Daily pipeline completed. date=%s adjust=%s", target_date, adjust)
-    finally:
-        await release_advisory_lock(db, lock_key)
+
+    runnable: list[str] = []
+    tasks = []
+    rule_files = _rule_files()
+    for strat in strategies:
+        rule_path = rule_files.get(strat)
+        if rule_path is None:
+            logger.warning(
+                "Strategy rule file not found, skip. strategy=%s path=%s",
+                strat,
+                _RULES_DIR / f"{strat}.tdx",
+            )
+            continue
+        runnable.append(strat)
+        tasks.append(_pick_one(strat, rule_path))
+
+    # 单个策略失败不中断整批
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for strat, res in zip(runnable, results):
+        if isinstance(res, BaseException):
+            logger.error("Stage 2/2: Stock picking failed. strategy=%s date=%s err=%s", strat, target_date, res)
+        else:
+            logger.info("Stage 2/2: Stock picking success. strategy=%s date=%s", strat, target_date)
+
+    # 全部阶段成功才记 ok：有失败时保留重跑资格（misfire 补跑/手动触发会再来）
+    all_ok = not any(isinstance(r, BaseException) for r in (*fetch_results, *results))
+    if all_ok:
+        await db.execute(_RUNS_MARK_SQL, target_date)
+    logger.info("Daily pipeline completed. date=%s adjust=%s all_ok=%s", target_date, adjust, all_ok)
 
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Optional
 from zoneinfo import ZoneInfo
 
+import asyncpg
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.cron import CronTrigger
 
-from backend.app.core.config import settings
+from backend.app.core.config import SETTINGS
 from backend.app.core.logging import get_logger
 from backend.app.db.database import Database
 from backend.app.jobs.daily_pipeline import run_daily_pipeline
@@ -15,16 +17,39 @@ from backend.app.jobs.daily_pipeline import run_daily_pipeline
 
 logger = get_logger(__name__)
 
+__all__ = ["start_scheduler", "stop_scheduler"]
 
-def start_scheduler(db: Database) -> AsyncIOScheduler:
-    if not getattr(settings, "scheduler_enabled", True):
-        tz = ZoneInfo(getattr(settings, "scheduler_timezone", "Asia/Shanghai"))
-        scheduler = AsyncIOScheduler(timezone=tz)
+# 触发器/默认参数均不随请求变化：模块级编译一次，重启重配时不再重复校验
+_JOB_DEFAULTS = {"coalesce": True, "max_instances": 1}
+_DAILY_TRIGGER = CronTrigger(
+    hour=SETTINGS.scheduler_hour,
+    minute=SETTINGS.scheduler_minute,
+    timezone=SETTINGS.scheduler_timezone,
+)
+
+# 调度器守护锁（与流水线锁区分，用 lock_key+1）：多 worker 部署下
+# 只有抢到锁的进程真正起调度器，其余进程连 cron 唤醒的成本都不付
+_SCHED_GUARD_SQL = "SELECT pg_try_advisory_lock($1);"
+# 持锁的专用连接：advisory lock 随连接存活，进程退出时自动释放
+_GUARD_CONN: Optional[asyncpg.Connection] = None
+
+
+async def start_scheduler(db: Database) -> AsyncIOScheduler:
+    global _GUARD_CONN
+    # 时区只解析一次，禁用/启用两条路径共用
+    tz = ZoneInfo(SETTINGS.scheduler_timezone)
+    scheduler = AsyncIOScheduler(timezone=tz, job_defaults=_JOB_DEFAULTS)
+    if not SETTINGS.scheduler_enabled:
         logger.info("Scheduler disabled by config")
         return scheduler
 
-    tz = ZoneInfo(getattr(settings, "scheduler_timezone", "Asia/Shanghai"))
-    scheduler = AsyncIOScheduler(timezone=tz)
+    conn = await db.pool.acquire()
+    got = await conn.fetchval(_SCHED_GUARD_SQL, int(SETTINGS.scheduler_lock_key) + 1)
+    if not got:
+        await db.pool.release(conn)
+        logger.info("Scheduler already active in another worker, disabled here")
+        return scheduler
+    _GUARD_CONN = conn
 
     async def job_runner():
         # 触发时按配置时区的“当天”运行
@@ -36,32 +61,43 @@ def start_scheduler(db: Database) -> AsyncIOScheduler:
 
     job = scheduler.add_job(
         job_runner,
-        CronTrigger(hour=getattr(settings, "scheduler_hour", 18), minute=getattr(settings, "scheduler_minute", 0)),
+        _DAILY_TRIGGER,
         id="daily_pipeline",
         replace_existing=True,
-        max_instances=1,
-        coalesce=True,
-        misfire_grace_time=getattr(settings, "scheduler_misfire_grace_seconds", 60 * 30),
+        misfire_grace_time=SETTINGS.scheduler_misfire_grace_seconds,
     )
     scheduler.start()
     logger.info(
         "Scheduler started: daily_pipeline at %02d:%02d %s next_run=%s",
-        getattr(settings, "scheduler_hour", 18),
-        getattr(settings, "scheduler_minute", 0),
-        getattr(settings, "scheduler_timezone", "Asia/Shanghai"),
+        SETTINGS.scheduler_hour,
+        SETTINGS.scheduler_minute,
+        SETTINGS.scheduler_timezone,
         job.next_run_time,
     )
 
     # 可选：启动即跑一次，用于验证/补数据
-    if getattr(settings, "scheduler_run_on_start", False):
+    if SETTINGS.scheduler_run_on_start:
         scheduler.add_job(
             job_runner,
             DateTrigger(run_date=datetime.now(tz)),
             id="daily_pipeline_run_on_start",
             replace_existing=True,
-            max_instances=1,
-            coalesce=True,
         )
         logger.info("Scheduler run-on-start enabled: will run daily pipeline immediately")
     return scheduler
 
+
+async def stop_scheduler(db: Database) -> None:
+    """
+    进程退出前释放守护锁连接。Pool.close() 会等所有已取出的连接归还，
+    不释放的话持锁进程的关闭流程会永远卡住。
+    """
+    global _GUARD_CONN
+    conn, _GUARD_CONN = _GUARD_CONN, None
+    if conn is None:
+        return
+    try:
+        await db.pool.release(conn)
+    except Exception:
+        logger.exception("Failed to release scheduler guard connection")
+
@@ -5,20 +5,19 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 
 from backend.app.api.routes import router as api_router
-from backend.app.api.schemas import ApiError
 from backend.app.core.config import settings
-from backend.app.core.logging import configure_logging, get_logger
+from backend.app.core.logging import configure_logging, get_logger, stop_logging_listener
 from backend.app.core.middleware import RequestIdMiddleware
 from backend.app.db.database import Database, DbConfig
 from backend.app.services.market_cap import MarketCapService
 from backend.app.repos.market_cap_repo import MarketCapRepo
 from backend.app.repos.indicators_repo import IndicatorsRepo
-from backend.app.jobs.scheduler import start_scheduler
+from backend.app.jobs.scheduler import start_scheduler, stop_scheduler
 
 
 logger = get_logger(__name__)
@@ -52,32 +51,48 @@ def create_app() -> FastAPI:
         app.state.db = db
 
         # 必须先执行 ind_repo.ensure_schema()，因为它负责创建 stock_basic 等基础表
-        # 否则 mc_repo.ensure_schema() 会因为外键引用不存在而报错
+        # 否则 mc_repo.ensure_schema() 会因为外键引用不存在而报错。
+        # ensure_once：多 worker 部署时只有第一个进程真正跑 DDL，其余进程用
+        # to_regclass 探测后直接跳过。探测对象取 ensure_schema 里最新加入的
+        # DDL（当前是 (code, adjust, trade_date) 周线索引），否则存量库会因
+        # 旧表已存在而跳过增量 DDL
+        schema_lock_key = int(settings.scheduler_lock_key) + 2
         ind_repo = IndicatorsRepo(db)
-        await ind_repo.ensure_schema()
+        await db.ensure_once(
+            "public.idx_stock_weekly_code_adjust_date", ind_repo.ensure_schema, lock_key=schema_lock_key
+        )
         app.state.indicators_repo = ind_repo
 
         # 初始化并确保缓存表存在
         mc_repo = MarketCapRepo(db)
-        await mc_repo.ensure_schema()
+        await db.ensure_once(
+            "public.stock_market_cap_latest", mc_repo.ensure_schema, lock_key=schema_lock_key
+        )
         app.state.market_cap = MarketCapService(repo=mc_repo, db=db)
 
         # 启动定时任务（生产环境建议单独跑 worker；这里先内置，便于开发/测试）
-        app.state.scheduler = start_scheduler(db)
+        app.state.scheduler = await start_scheduler(db)
 
         try:
             yield
         finally:
+            # 未选上调度器的 worker 拿到的是没 start 的实例，
+            # 直接 shutdown 会抛 SchedulerNotRunningError，跳过后面的清理
             sch = getattr(app.state, "scheduler", None)
-            if sch is not None:
+            if sch is not None and sch.running:
                 sch.shutdown(wait=False)
+            # 守护锁连接必须先归还，否则 db.close() 等待归还时卡死
+            await stop_scheduler(db)
             await db.close()
+            stop_logging_listener()
 
     app = FastAPI(
         title=settings.app_name,
         docs_url="/docs" if settings.env != "prod" else None,
         redoc_url=None,
         openapi_url="/openapi.json" if settings.env != "prod" else None,
+        # orjson 在 C 层序列化，大响应（picks bundle）收益明显
+        default_response_class=ORJSONResponse,
         lifespan=lifespan,
     )
 
@@ -95,22 +110,26 @@ def create_app() -> FastAPI:
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.allowed_hosts)
     app.add_middleware(RequestIdMiddleware)
 
+    # 错误出口直接拼 dict：出参完全受我们控制，无需再过一遍 pydantic 校验器；
+    # 高 422 率（bot 流量）下省掉每个错误响应一次模型构造 + model_dump。
+    # ApiError 模型仅保留给 openapi 文档描述错误结构。
+
     @app.exception_handler(StarletteHTTPException)
     async def http_exception_handler(request: Request, exc: StarletteHTTPException):
         rid = getattr(request.state, "request_id", None)
         # 统一错误格式；message 尽量稳定，不暴露内部细节
         msg = exc.detail if isinstance(exc.detail, str) else "http_error"
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=exc.status_code,
-            content=ApiError(code=exc.status_code, message=msg, request_id=rid).model_dump(),
+            content={"code": exc.status_code, "message": msg, "request_id": rid, "details": None},
         )
 
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError):
         rid = getattr(request.state, "request_id", None)
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=422,
-            content=ApiError(code=422, message="validation_error", request_id=rid, details=exc.errors()).model_dump(),
+            content={"code": 422, "message": "validation_error", "request_id": rid, "details": exc.errors()},
         )
 
     @app.exception_handler(Exception)
@@ -118,9 +137,9 @@ def create_app() -> FastAPI:
         # 避免把异常细节直接暴露给客户端；细节留在日志里
         rid = getattr(request.state, "request_id", None)
         logger.exception("Unhandled exception. request_id=%s path=%s", rid, request.url.path)
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
-            content=ApiError(code=500, message="internal_server_error", request_id=rid).model_dump(),
+            content={"code": 500, "message": "internal_server_error", "request_id": rid, "details": None},
         )
 
     app.include_router(api_router)
@@ -1,14 +1,40 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
 from datetime import date
-from typing import Any, Optional
+from itertools import repeat
 
 import pandas as pd
 
 from backend.app.db.database import Database
 
 
+# 指标 upsert 的列与合并片段（日/周线表结构一致，共用常量）
+_IND_COLS = (
+    "code",
+    "trade_date",
+    "adjust",
+    "macd_dif",
+    "macd_dea",
+    "macd_hist",
+    "kdj_k",
+    "kdj_d",
+    "kdj_j",
+    "short_trend_line",
+    "bull_bear_line",
+)
+_IND_UPDATE_SET = """
+  macd_dif = EXCLUDED.macd_dif,
+  macd_dea = EXCLUDED.macd_dea,
+  macd_hist = EXCLUDED.macd_hist,
+  kdj_k = EXCLUDED.kdj_k,
+  kdj_d = EXCLUDED.kdj_d,
+  kdj_j = EXCLUDED.kdj_j,
+  short_trend_line = EXCLUDED.short_trend_line,
+  bull_bear_line = EXCLUDED.bull_bear_line,
+  updated_at = NOW()
+"""
+
+
 class IndicatorsRepo:
     """
     指标缓存表（按 code+trade_date+adjust 存储）。
@@ -54,6 +80,11 @@ class IndicatorsRepo:
             """
         )
         await self.db.execute("CREATE INDEX IF NOT EXISTS idx_stock_daily_trade_date ON stock_daily(trade_date);")
+        # 批量加载（code = ANY + adjust + 日期范围）的覆盖索引：
+        # 主键列序是 (code, trade_date, adjust)，adjust 在第三位只能当过滤条件用
+        await self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stock_daily_code_adjust_date ON stock_daily(code, adjust, trade_date);"
+        )
 
         # 周线数据表
         await self.db.execute(
@@ -77,6 +108,9 @@ class IndicatorsRepo:
             """
         )
         await self.db.execute("CREATE INDEX IF NOT EXISTS idx_stock_weekly_trade_date ON stock_weekly(trade_date);")
+        await self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stock_weekly_code_adjust_date ON stock_weekly(code, adjust, trade_date);"
+        )
 
         # 日线指标
         await self.db.execute(
@@ -131,7 +165,7 @@ class IndicatorsRepo:
                    i.short_trend_line, i.bull_bear_line
             FROM stock_daily d
             LEFT JOIN stock_daily_indicators i
-              ON i.code = d.code AND i.trade_date = d.trade_date AND i.adjust = d.adjust
+              USING (code, trade_date, adjust)
             WHERE d.code = $1 AND d.adjust = $2 AND d.trade_date BETWEEN $3 AND $4
             ORDER BY d.trade_date;
             """,
@@ -140,10 +174,61 @@ class IndicatorsRepo:
             start,
             end,
         )
-        return (
-            pd.DataFrame(rows)
-            if rows
-            else pd.DataFrame(
+        return self._rows_to_df(rows)
+
+    async def load_daily_join_many(self, codes: list[str], start: date, end: date, adjust: str) -> dict[str, pd.DataFrame]:
+        """
+        一次 SQL 取整页股票的日K+指标，返回 {code: DataFrame}。
+        相比逐只 load_daily_join，把 N 次往返合并为 1 次。
+        """
+        if not codes:
+            return {}
+        rows = await self.db.fetch(
+            """
+            SELECT d.code, d.trade_date, d.open, d.high, d.low, d.close, d.volume, d.amount,
+                   d.amplitude, d.pct_change, d.change_amount, d.turnover_rate,
+                   i.macd_dif, i.macd_dea, i.macd_hist, i.kdj_k, i.kdj_d, i.kdj_j,
+                   i.short_trend_line, i.bull_bear_line
+            FROM stock_daily d
+            LEFT JOIN stock_daily_indicators i
+              USING (code, trade_date, adjust)
+            WHERE d.code = ANY($1::text[]) AND d.adjust = $2 AND d.trade_date BETWEEN $3 AND $4
+            ORDER BY d.code, d.trade_date;
+            """,
+            list(codes),
+            adjust,
+            start,
+            end,
+        )
+        return self._split_by_code(rows)
+
+    async def load_weekly_join_many(self, codes: list[str], start: date, end: date, adjust: str) -> dict[str, pd.DataFrame]:
+        """同 load_daily_join_many，但取周K。"""
+        if not codes:
+            return {}
+        rows = await self.db.fetch(
+            """
+            SELECT w.code, w.trade_date, w.open, w.high, w.low, w.close, w.volume, w.amount,
+                   w.amplitude, w.pct_change, w.change_amount, w.turnover_rate,
+                   i.macd_dif, i.macd_dea, i.macd_hist, i.kdj_k, i.kdj_d, i.kdj_j,
+                   i.short_trend_line, i.bull_bear_line
+            FROM stock_weekly w
+            LEFT JOIN stock_weekly_indicators i
+              USING (code, trade_date, adjust)
+            WHERE w.code = ANY($1::text[]) AND w.adjust = $2 AND w.trade_date BETWEEN $3 AND $4
+            ORDER BY w.code, w.trade_date;
+            """,
+            list(codes),
+            adjust,
+            start,
+            end,
+        )
+        return self._split_by_code(rows)
+
+    @staticmethod
+    def _rows_to_df(rows: list) -> pd.DataFrame:
+        if not rows:
+            return pd.DataFrame(
                 columns=[
                     "trade_date",
                     "open",
@@ -158,7 +243,24 @@ class IndicatorsRepo:
                     "turnover_rate",
                 ]
             )
-        )
+        # asyncpg Record 是序列语义：需显式给出列名
+        df = pd.DataFrame(rows, columns=list(rows[0].keys()))
+        # trade_date 统一转 datetime64：下游序列化可直接走向量化 .dt.strftime
+        df["trade_date"] = pd.to_datetime(df["trade_date"])
+        return df
+
+    @staticmethod
+    def _split_by_code(rows: list) -> dict[str, pd.DataFrame]:
+        if not rows:
+            return {}
+        df = pd.DataFrame(rows, columns=list(rows[0].keys()))
+        df["code"] = df["code"].astype(str).str.strip()
+        # trade_date 统一转 datetime64：下游序列化可直接走向量化 .dt.strftime
+        df["trade_date"] = pd.to_datetime(df["trade_date"])
+        return {
+            str(code): g.drop(columns=["code"]).reset_index(drop=True)
+            for code, g in df.groupby("code", sort=False)
+        }
 
     async def load_weekly_join(self, code: str, start: date, end: date, adjust: str) -> pd.DataFrame:
         rows = await self.db.fetch(
@@ -169,7 +271,7 @@ class IndicatorsRepo:
                    i.short_trend_line, i.bull_bear_line
             FROM stock_weekly w
             LEFT JOIN stock_weekly_indicators i
-              ON i.code = w.code AND i.trade_date = w.trade_date AND i.adjust = w.adjust
+              USING (code, trade_date, adjust)
             WHERE w.code = $1 AND w.adjust = $2 AND w.trade_date BETWEEN $3 AND $4
             ORDER BY w.trade_date;
             """,
@@ -178,114 +280,40 @@ class IndicatorsRepo:
             start,
             end,
         )
-        return (
-            pd.DataFrame(rows)
-            if rows
-            else pd.DataFrame(
-                columns=[
-                    "trade_date",
-                    "open",
-                    "high",
-                    "low",
-                    "close",
-                    "volume",
-                    "amount",
-                    "amplitude",
-                    "pct_change",
-                    "change_amount",
-                    "turnover_rate",
-                ]
-            )
-        )
+        return self._rows_to_df(rows)
+
+    @staticmethod
+    def _ind_rows(code: str, adjust: str, df: pd.DataFrame) -> list[tuple]:
+        # 列式抽行：每列一次 tolist()，zip 拼成 COPY 记录；
+        # 替代 itertuples + 逐字段 getattr 的行级 namedtuple 访问
+        n = len(df)
+        ind_cols = [
+            df[c].tolist() if c in df.columns else [None] * n
+            for c in _IND_COLS[3:]
+        ]
+        return list(zip(repeat(code, n), df["trade_date"].tolist(), repeat(adjust, n), *ind_cols))
 
     async def upsert_daily(self, code: str, adjust: str, df: pd.DataFrame) -> None:
         if df.empty:
             return
-        rows = []
-        for r in df.itertuples(index=False):
-            rows.append(
-                (
-                    code,
-                    r.trade_date,
-                    adjust,
-                    getattr(r, "macd_dif", None),
-                    getattr(r, "macd_dea", None),
-                    getattr(r, "macd_hist", None),
-                    getattr(r, "kdj_k", None),
-                    getattr(r, "kdj_d", None),
-                    getattr(r, "kdj_j", None),
-                    getattr(r, "short_trend_line", None),
-                    getattr(r, "bull_bear_line", None),
-                )
-            )
-
-        async with self.db.pool.acquire() as conn:
-            await conn.executemany(
-                """
-                INSERT INTO stock_daily_indicators(
-                  code, trade_date, adjust,
-                  macd_dif, macd_dea, macd_hist,
-                  kdj_k, kdj_d, kdj_j,
-                  short_trend_line, bull_bear_line
-                )
-                VALUES($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11)
-                ON CONFLICT (code, trade_date, adjust) DO UPDATE SET
-                  macd_dif = EXCLUDED.macd_dif,
-                  macd_dea = EXCLUDED.macd_dea,
-                  macd_hist = EXCLUDED.macd_hist,
-                  kdj_k = EXCLUDED.kdj_k,
-                  kdj_d = EXCLUDED.kdj_d,
-                  kdj_j = EXCLUDED.kdj_j,
-                  short_trend_line = EXCLUDED.short_trend_line,
-                  bull_bear_line = EXCLUDED.bull_bear_line,
-                  updated_at = NOW();
-                """,
-                rows,
-            )
+        # 二进制 COPY + 临时表合并，整批一次落库
+        await self.db.copy_upsert(
+            "stock_daily_indicators",
+            _IND_COLS,
+            self._ind_rows(code, adjust, df),
+            conflict_columns=("code", "trade_date", "adjust"),
+            update_set=_IND_UPDATE_SET,
+        )
 
     async def upsert_weekly(self, code: str, adjust: str, df: pd.DataFrame) -> None:
         if df.empty:
             return
-        rows = []
-        for r in df.itertuples(index=False):
-            rows.append(
-                (
-                    code,
-                    r.trade_date,
-                    adjust,
-                    getattr(r, "macd_dif", None),
-                    getattr(r, "macd_dea", None),
-                    getattr(r, "macd_hist", None),
-                    getattr(r, "kdj_k", None),
-                    getattr(r, "kdj_d", None),
-                    getattr(r, "kdj_j", None),
-                    getattr(r, "short_trend_line", None),
-                    getattr(r, "bull_bear_line", None),
-                )
-            )
-
-        async with self.db.pool.acquire() as conn:
-            await conn.executemany(
-                """
-                INSERT INTO stock_weekly_indicators(
-                  code, trade_date, adjust,
-                  macd_dif, macd_dea, macd_hist,
-                  kdj_k, kdj_d, kdj_j,
-                  short_trend_line, bull_bear_line
-                )
-                VALUES($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11)
-                ON CONFLICT (code, trade_date, adjust) DO UPDATE SET
-                  macd_dif = EXCLUDED.macd_dif,
-                  macd_dea = EXCLUDED.macd_dea,
-                  macd_hist = EXCLUDED.macd_hist,
-                  kdj_k = EXCLUDED.kdj_k,
-                  kdj_d = EXCLUDED.kdj_d,
-                  kdj_j = EXCLUDED.kdj_j,
-                  short_trend_line = EXCLUDED.short_trend_line,
-                  bull_bear_line = EXCLUDED.bull_bear_line,
-                  updated_at = NOW();
-                """,
-                rows,
-            )
+        await self.db.copy_upsert(
+            "stock_weekly_indicators",
+            _IND_COLS,
+            self._ind_rows(code, adjust, df),
+            conflict_columns=("code", "trade_date", "adjust"),
+            update_set=_IND_UPDATE_SET,
+        )
 
 
@@ -1,45 +1,51 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import io
 from datetime import date
-from typing import Any
 
 import pandas as pd
 
+from backend.app.core.logging import get_logger
 from backend.app.db.database import Database
 
 
+logger = get_logger(__name__)
+
+_KLINE_COLS = ["trade_date", "open", "high", "low", "close", "volume", "amount"]
+
+# COPY 版不带结尾分号（会被包进 COPY (...) TO STDOUT）；fetch 回退版共用同一文本
+_DAILY_SQL = """
+SELECT trade_date, open, high, low, close, volume, amount
+FROM stock_daily
+WHERE code = $1 AND adjust = $2 AND trade_date BETWEEN $3 AND $4
+ORDER BY trade_date
+"""
+_WEEKLY_SQL = """
+SELECT trade_date, open, high, low, close, volume, amount
+FROM stock_weekly
+WHERE code = $1 AND adjust = $2 AND trade_date BETWEEN $3 AND $4
+ORDER BY trade_date
+"""
+
+
 class KlineRepo:
     def __init__(self, db: Database):
         self.db = db
 
     async def load_daily(self, code: str, start: date, end: date, adjust: str) -> pd.DataFrame:
-        rows = await self.db.fetch(
-            """
-            SELECT trade_date, open, high, low, close, volume, amount
-            FROM stock_daily
-            WHERE code = $1 AND adjust = $2 AND trade_date BETWEEN $3 AND $4
-            ORDER BY trade_date;
-            """,
-            code,
-            adjust,
-            start,
-            end,
-        )
-        return pd.DataFrame(rows) if rows else pd.DataFrame(columns=["trade_date", "open", "high", "low", "close", "volume", "amount"])
+        return await self._load(_DAILY_SQL, code, start, end, adjust)
 
     async def load_weekly(self, code: str, start: date, end: date, adjust: str) -> pd.DataFrame:
-        rows = await self.db.fetch(
-            """
-            SELECT trade_date, open, high, low, close, volume, amount
-            FROM stock_weekly
-            WHERE code = $1 AND adjust = $2 AND trade_date BETWEEN $3 AND $4
-            ORDER BY trade_date;
-            """,
-            code,
-            adjust,
-            start,
-            end,
-        )
-        return pd.DataFrame(rows) if rows else pd.DataFrame(columns=["trade_date", "open", "high", "low", "close", "volume", "amount"])
-
+        return await self._load(_WEEKLY_SQL, code, start, end, adjust)
+
+    async def _load(self, sql: str, code: str, start: date, end: date, adjust: str) -> pd.DataFrame:
+        # 首选 COPY TO STDOUT (csv)：服务端一次性流出整块结果，跳过逐行
+        # Record 组装，pandas 的 C 解析器直接吃字节流；失败时回退 fetch 路径
+        try:
+            raw = await self.db.copy_query_csv(sql, code, adjust, start, end)
+            return pd.read_csv(io.BytesIO(raw), parse_dates=["trade_date"])
+        except Exception:
+            logger.exception("Kline COPY load failed, falling back to fetch. code=%s", code)
+        rows = await self.db.fetch(sql, code, adjust, start, end)
+        # asyncpg Record 是序列语义：需显式给出列名
+        return pd.DataFrame(rows, columns=_KLINE_COLS) if rows else pd.DataFrame(columns=_KLINE_COLS)
@@ -49,6 +49,52 @@ class MarketCapRepo:
             as_of_date=row["as_of_date"],
         )
 
+    async def get_latest_many(self, codes: list[str]) -> dict[str, MarketCapRow]:
+        """一次查询取整页股票的最新市值缓存，返回 {code: MarketCapRow}。"""
+        if not codes:
+            return {}
+        rows = await self.db.fetch(
+            """
+            SELECT code, market_cap, as_of_date
+            FROM stock_market_cap_latest
+            WHERE code = ANY($1::text[]);
+            """,
+            list(codes),
+        )
+        out: dict[str, MarketCapRow] = {}
+        for row in rows:
+            code = str(row["code"]).strip()
+            out[code] = MarketCapRow(
+                code=code,
+                market_cap=row.get("market_cap"),
+                as_of_date=row["as_of_date"],
+            )
+        return out
+
+    async def bulk_upsert(self, rows: list[tuple[str, Optional[float]]], as_of_date: date) -> None:
+        """
+        全市场快照批量 upsert：unnest 展开成单条语句，一次往返落库。
+        只写 stock_basic 已有的代码（满足外键）；调用方需保证 code 不重复，
+        否则 ON CONFLICT 在同一语句内二次命中同行会报错。
+        """
+        if not rows:
+            return
+        await self.db.execute(
+            """
+            INSERT INTO stock_market_cap_latest(code, market_cap, as_of_date)
+            SELECT t.code, t.market_cap, $3
+            FROM unnest($1::text[], $2::float8[]) AS t(code, market_cap)
+            JOIN stock_basic b ON b.code = t.code
+            ON CONFLICT (code) DO UPDATE SET
+              market_cap = EXCLUDED.market_cap,
+              as_of_date = EXCLUDED.as_of_date,
+              updated_at = NOW();
+            """,
+            [r[0] for r in rows],
+            [r[1] for r in rows],
+            as_of_date,
+        )
+
     async def upsert_latest(self, code: str, market_cap: Optional[float], as_of_date: date) -> None:
         await self.db.execute(
             """
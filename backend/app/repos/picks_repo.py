@@ -2,8 +2,8 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import date
+from functools import lru_cache
 from typing import Any, Optional
-import json
 
 import asyncpg
 
@@ -18,13 +18,20 @@ class PickRow:
     metrics: Optional[dict[str, Any]]
 
 
+@lru_cache(maxsize=4096)
+def _qualified_table(prefix: str, trade_date: date) -> str:
+    # strftime + 标识符校验/加引号按 (prefix, 交易日) 记忆化：
+    # 热门交易日高 QPS 反复请求时直接命中；明确 schema 避免 search_path 问题
+    return f'public.{Database.quote_ident(f"{prefix}{trade_date:%Y%m%d}")}'
+
+
 class PicksRepo:
     def __init__(self, db: Database, table_prefix: str = "stock_pick_results_"):
         self.db = db
         self.table_prefix = table_prefix
 
     def table_name_for_date(self, trade_date: date) -> str:
-        return f"{self.table_prefix}{trade_date.strftime('%Y%m%d')}"
+        return f"{self.table_prefix}{trade_date:%Y%m%d}"
 
     async def list_picks(
         self,
@@ -33,9 +40,7 @@ class PicksRepo:
         limit: int,
         cursor_code: str = "",
     ) -> list[PickRow]:
-        table = self.table_name_for_date(trade_date)
-        # 明确 schema，避免 search_path 导致的 “relation does not exist”
-        t = f'public.{self.db.quote_ident(table)}'
+        t = _qualified_table(self.table_prefix, trade_date)
 
         # cursor pagination by code
         query = f"""
@@ -49,16 +54,13 @@ class PicksRepo:
         try:
             rows = await self.db.fetch(query, rule_name, cursor_code, limit)
         except asyncpg.UndefinedTableError as e:
-            raise FileNotFoundError(f"Pick result table not found: {table}") from e
+            raise FileNotFoundError(
+                f"Pick result table not found: {self.table_name_for_date(trade_date)}"
+            ) from e
         out: list[PickRow] = []
         for r in rows:
+            # jsonb 已在连接层由 orjson 解码为 dict（见 Database._init_connection）
             metrics = r.get("metrics")
-            # asyncpg jsonb 可能返回 dict，也可能返回 str
-            if isinstance(metrics, str):
-                try:
-                    metrics = json.loads(metrics)
-                except Exception:
-                    metrics = None
             out.append(
                 PickRow(
                     code=str(r["code"]).strip(),
@@ -70,8 +72,7 @@ class PicksRepo:
         return out
 
     async def count_picks(self, rule_name: str, trade_date: date) -> int:
-        table = self.table_name_for_date(trade_date)
-        t = f'public.{self.db.quote_ident(table)}'
+        t = _qualified_table(self.table_prefix, trade_date)
         query = f"SELECT count(*) FROM {t} WHERE rule_name = $1"
         try:
             val = await self.db.fetchval(query, rule_name)
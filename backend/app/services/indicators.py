@@ -1,65 +1,212 @@
 from __future__ import annotations
 
+import hashlib
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 
+try:
+    # numba 为可选依赖：装了就 JIT 编译递推内核，没装则退化为纯 Python 循环
+    from numba import njit
+
+    _HAVE_NUMBA = True
+except ImportError:  # pragma: no cover
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        def wrap(fn):
+            return fn
+
+        if args and callable(args[0]):
+            return args[0]
+        return wrap
+
+
+try:
+    # scipy 同为可选：没有 numba 时，一阶 IIR 滤波器等价实现 SMA 递推，
+    # lfilter 在 C 层单趟跑完，仍比纯 Python 循环快 1~2 个量级
+    from scipy.signal import lfilter as _lfilter
+except ImportError:  # pragma: no cover
+    _lfilter = None
+
+try:
+    # bottleneck 可选：move_min/move_max 是单调队列 O(N) C 实现，
+    # KDJ 的滚动极值比 pandas rolling 快数倍；未装则走 pandas
+    import bottleneck as _bn
+except ImportError:  # pragma: no cover
+    _bn = None
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _sma_tdx_kernel(x: np.ndarray, n: int, m: int) -> np.ndarray:
+    out = np.empty_like(x)
+    out[0] = x[0]
+    for i in range(1, len(x)):
+        out[i] = (m * x[i] + (n - m) * out[i - 1]) / n
+    return out
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _ewm_kernel(x: np.ndarray, alpha: float) -> np.ndarray:
+    # pandas ewm(span, adjust=False) 的递推形式：y = α*x + (1-α)*y_prev
+    out = np.empty_like(x)
+    out[0] = x[0]
+    for i in range(1, len(x)):
+        out[i] = alpha * x[i] + (1.0 - alpha) * out[i - 1]
+    return out
+
+
+# 导入时用 2 个元素预热：numba 首次调用才编译，放这里把编译成本从第一笔
+# KDJ 计算挪到进程启动；cache=True 时二次启动只是从磁盘缓存加载，基本免费。
+# 未装 numba 时这就是两次普通循环迭代，可忽略
+_sma_tdx_kernel(np.zeros(2, dtype=np.float64), 9, 1)
+_ewm_kernel(np.zeros(2, dtype=np.float64), 0.5)
+
+
+def _sma_tdx_lfilter(arr: np.ndarray, n: int, m: int) -> np.ndarray:
+    # 递推即单极点 IIR：y[i] = (m/n)*x[i] + ((n-m)/n)*y[i-1]；
+    # 初态 zi 取 x[0]*(n-m)/n，使 y[0] = x[0]，与递推定义一致
+    b = (m / n,)
+    a = (1.0, -(n - m) / n)
+    zi = np.array([arr[0] * (n - m) / n])
+    y, _ = _lfilter(b, a, arr, zi=zi)
+    return y
+
+
+def _sma_arr(arr: np.ndarray, n: int, m: int) -> np.ndarray:
+    if not _HAVE_NUMBA and _lfilter is not None:
+        return _sma_tdx_lfilter(arr, n, m)
+    return _sma_tdx_kernel(arr, n, m)
+
+
+def _ewm_arr(arr: np.ndarray, span: int) -> np.ndarray:
+    """ewm(span, adjust=False).mean() 的数组版：同样按 numba → lfilter → pandas 分层。"""
+    alpha = 2.0 / (span + 1.0)
+    if _HAVE_NUMBA:
+        return _ewm_kernel(arr, alpha)
+    if _lfilter is not None:
+        y, _ = _lfilter((alpha,), (1.0, -(1.0 - alpha)), arr, zi=np.array([arr[0] * (1.0 - alpha)]))
+        return y
+    return pd.Series(arr).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
 
 def sma_tdx(x: pd.Series, n: int, m: int) -> pd.Series:
     """
     通达信 SMA(X,N,M) 递推：
       SMA = (M*X + (N-M)*REF(SMA,1)) / N
+    优先走 numba 内核；未装 numba 时退到 scipy.lfilter（C 层 IIR），
+    两者都没有才是纯 Python 循环。
     """
-    x = x.astype(float)
-    out = pd.Series(index=x.index, dtype="float64")
+    if n <= 0:
+        raise ValueError(f"sma_tdx requires n > 0, got {n}")
     if len(x) == 0:
-        return out
-    out.iloc[0] = x.iloc[0]
-    for i in range(1, len(x)):
-        out.iloc[i] = (m * x.iloc[i] + (n - m) * out.iloc[i - 1]) / n
-    return out
+        return pd.Series(index=x.index, dtype="float64")
+    return pd.Series(_sma_arr(x.to_numpy(dtype="float64"), n, m), index=x.index)
 
 
-def kdj(df: pd.DataFrame, n: int = 9, k_n: int = 3, d_n: int = 3) -> pd.DataFrame:
-    low_n = df["low"].rolling(window=n, min_periods=1).min()
-    high_n = df["high"].rolling(window=n, min_periods=1).max()
-    denom = (high_n - low_n).replace(0, np.nan)
-    rsv = (df["close"] - low_n) / denom * 100.0
-    rsv = rsv.fillna(0.0)
-
-    k = sma_tdx(rsv, k_n, 1)
-    d = sma_tdx(k, d_n, 1)
+def _kdj_arrays(
+    high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int, k_n: int, d_n: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # 滚动极值：优先 bottleneck 的单调队列 C 实现（min_count=1 与
+    # rolling(min_periods=1) 的 NaN 语义一致），未装则走 pandas 的 C 路径；
+    # 之后的 RSV/递推全在 numpy 数组上做
+    if _bn is not None:
+        low_n = _bn.move_min(low, window=n, min_count=1)
+        high_n = _bn.move_max(high, window=n, min_count=1)
+    else:
+        low_n = pd.Series(low).rolling(window=n, min_periods=1).min().to_numpy()
+        high_n = pd.Series(high).rolling(window=n, min_periods=1).max().to_numpy()
+    # 无分支写法：平盘窗口（denom==0）直接给 0，不再经 NaN 注入 + 二次扫描清理；
+    # 除数换成 1 只是避免除零警告，对应位置的结果会被 where 丢弃。
+    # close 缺失产生的 NaN 仍按旧 fillna(0) 语义清零
+    denom = high_n - low_n
+    rsv = np.where(denom > 0.0, (close - low_n) / np.where(denom > 0.0, denom, 1.0) * 100.0, 0.0)
+    rsv = np.nan_to_num(rsv, nan=0.0, copy=False)
+    k = _sma_arr(rsv, k_n, 1)
+    d = _sma_arr(k, d_n, 1)
     j = 3 * k - 2 * d
-    return pd.DataFrame({"kdj_k": k, "kdj_d": d, "kdj_j": j})
+    return k, d, j
 
 
-def macd(df: pd.DataFrame, fast: int = 12, slow: int = 26, signal: int = 9) -> pd.DataFrame:
-    ema_fast = df["close"].ewm(span=fast, adjust=False).mean()
-    ema_slow = df["close"].ewm(span=slow, adjust=False).mean()
-    dif = ema_fast - ema_slow
-    dea = dif.ewm(span=signal, adjust=False).mean()
+def _macd_arrays(
+    close: np.ndarray, fast: int, slow: int, signal: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    dif = _ewm_arr(close, fast) - _ewm_arr(close, slow)
+    dea = _ewm_arr(dif, signal)
     hist = 2 * (dif - dea)
-    return pd.DataFrame({"macd_dif": dif, "macd_dea": dea, "macd_hist": hist})
+    return dif, dea, hist
+
+
+def kdj(df: pd.DataFrame, n: int = 9, k_n: int = 3, d_n: int = 3) -> pd.DataFrame:
+    high = df["high"].to_numpy(dtype="float64")
+    low = df["low"].to_numpy(dtype="float64")
+    close = df["close"].to_numpy(dtype="float64")
+    k, d, j = _kdj_arrays(high, low, close, n, k_n, d_n)
+    return pd.DataFrame({"kdj_k": k, "kdj_d": d, "kdj_j": j}, index=df.index)
+
+
+def macd(df: pd.DataFrame, fast: int = 12, slow: int = 26, signal: int = 9) -> pd.DataFrame:
+    close = df["close"].to_numpy(dtype="float64")
+    dif, dea, hist = _macd_arrays(close, fast, slow, signal)
+    return pd.DataFrame({"macd_dif": dif, "macd_dea": dea, "macd_hist": hist}, index=df.index)
 
 
 def short_trend_line(df: pd.DataFrame, n: int = 10) -> pd.Series:
-    return df["close"].ewm(span=n, adjust=False).mean().ewm(span=n, adjust=False).mean()
+    close = df["close"].to_numpy(dtype="float64")
+    return pd.Series(_ewm_arr(_ewm_arr(close, n), n), index=df.index)
 
 
 def bull_bear_line(df: pd.DataFrame, periods: tuple[int, int, int, int] = (14, 28, 57, 114)) -> pd.Series:
+    if _bn is not None:
+        # 四条均线共用同一份 close 数组，move_mean 在 C 层滑动求和，
+        # 结果累加进一个缓冲区，免掉 4 个中间 Series
+        c = df["close"].to_numpy(dtype="float64")
+        acc = np.zeros_like(c)
+        for p in periods:
+            acc += _bn.move_mean(c, window=p, min_count=1)
+        return pd.Series(acc / float(len(periods)), index=df.index)
     ma = [df["close"].rolling(window=p, min_periods=1).mean() for p in periods]
     return sum(ma) / float(len(ma))
 
 
-def enrich_indicators(df: pd.DataFrame) -> pd.DataFrame:
+# enrich 输出记忆化：键为 (行数, OHLC 内容摘要)，值为整组指标数组。
+# 约 4k 只股票 × 日/周两个频率的量级；backfill/多接口重复算同一窗口时直接命中。
+# enrich_indicators 会被 asyncio.to_thread 并发调用，LRU 的读改/插入淘汰需加锁
+_ENRICH_MEMO: "OrderedDict[tuple[int, bytes], dict[str, np.ndarray]]" = OrderedDict()
+_ENRICH_MEMO_MAX = 8192
+_ENRICH_MEMO_LOCK = threading.Lock()
+
+
+def _arrays_digest(*arrays: np.ndarray) -> bytes:
+    # blake2b 在短输入上吞吐足够（几 KB 的 float64 列摘要 ~微秒级），
+    # 且是标准库；不值得为此引入 xxhash 依赖
+    h = hashlib.blake2b(digest_size=16)
+    for a in arrays:
+        h.update(a.tobytes())
+    return h.digest()
+
+
+def enrich_indicators(df: pd.DataFrame, *, inplace: bool = False) -> pd.DataFrame:
     """
     输入 df 需要包含：
       trade_date/open/high/low/close/volume/amount
-    输出：在原 df 上附加 macd/kdj/短期趋势线/知行多空线
+    输出：在原 df 上附加 macd/kdj/短期趋势线/知行多空线。
+    inplace=True 时直接在传入 frame 上写列（调用方确认 frame 可弃用时省一份拷贝）。
     """
     if df.empty:
         return df
-    out = df.copy()
-    out = out.sort_values("trade_date").reset_index(drop=True)
+    if inplace:
+        out = df
+        if not out["trade_date"].is_monotonic_increasing:
+            out.sort_values("trade_date", inplace=True, ignore_index=True)
+    elif df["trade_date"].is_monotonic_increasing:
+        # 常态：SQL 已 ORDER BY trade_date。浅拷贝共享列块，新增/替换列只写进
+        # 新 frame 的 block manager，原 df 不动，省掉 sort_values 的整表深拷贝
+        out = df.copy(deep=False)
+    else:
+        out = df.sort_values("trade_date", ignore_index=True)
 
     # asyncpg/psycopg2 可能返回 Decimal，统一转为 float，避免计算报错
     for c in ("open", "high", "low", "close", "amount"):
@@ -69,9 +216,44 @@ def enrich_indicators(df: pd.DataFrame) -> pd.DataFrame:
         # volume 用整数，但缺失时允许 NaN
         out["volume"] = pd.to_numeric(out["volume"], errors="coerce")
 
-    out["short_trend_line"] = short_trend_line(out)
-    out["bull_bear_line"] = bull_bear_line(out)
+    # SoA：高/低/收各抽一次连续 float64 数组，MACD/KDJ/STL 共享同一份缓存驻留数据；
+    # 结果按列直接写回，替代原来的 pd.concat 整表重排
+    high = out["high"].to_numpy(dtype="float64")
+    low = out["low"].to_numpy(dtype="float64")
+    close = np.ascontiguousarray(out["close"].to_numpy(dtype="float64"))
+
+    # 内容哈希记忆化：指标只由 OHLC 序列决定，同一窗口（不同接口/重试/
+    # 日内重复回填）直接复用整组输出数组，不再重跑 EMA/KDJ 递推
+    key = (len(out), _arrays_digest(high, low, close))
+    with _ENRICH_MEMO_LOCK:
+        hit = _ENRICH_MEMO.get(key)
+        if hit is not None:
+            _ENRICH_MEMO.move_to_end(key)
+    if hit is not None:
+        for name, arr in hit.items():
+            out[name] = arr
+        return out
+
+    stl = _ewm_arr(_ewm_arr(close, 10), 10)
+    bbl = bull_bear_line(out).to_numpy()
+    dif, dea, hist = _macd_arrays(close, 12, 26, 9)
+    k, d, j = _kdj_arrays(high, low, close, 9, 3, 3)
 
-    out = pd.concat([out, macd(out), kdj(out)], axis=1)
+    computed = {
+        "short_trend_line": stl,
+        "bull_bear_line": bbl,
+        "macd_dif": dif,
+        "macd_dea": dea,
+        "macd_hist": hist,
+        "kdj_k": k,
+        "kdj_d": d,
+        "kdj_j": j,
+    }
+    for name, arr in computed.items():
+        out[name] = arr
+    with _ENRICH_MEMO_LOCK:
+        _ENRICH_MEMO[key] = computed
+        if len(_ENRICH_MEMO) > _ENRICH_MEMO_MAX:
+            _ENRICH_MEMO.popitem(last=False)
     return out
 
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import re
 import time
 from dataclasses import dataclass
@@ -15,6 +16,40 @@ from backend.app.repos.market_cap_repo import MarketCapRepo
 
 logger = get_logger(__name__)
 
+# 兜底用的数字抽取正则提到模块级：每次调用省掉 re 内部缓存的探测开销
+_MC_STRIP_RE = re.compile(r"[^0-9.]")
+
+# 单位集合小且固定：后缀查表 + float() 替代正则匹配。
+# “万亿”要先于“万”检查（endswith 前缀包含关系）
+_MC_UNITS = (("万亿", 1e12), ("亿", 1e8), ("万", 1e4))
+_MC_SENTINELS = frozenset({"", "nan", "none", "--"})
+
+
+class _TokenBucket:
+    """
+    异步令牌桶：限制打外部源（东财）的频率，避免被限流后进入重试恶性循环。
+    TTL/DB 缓存命中不经过桶；桶只约束真正的外部请求。
+    """
+
+    def __init__(self, calls_per_minute: int = 50, burst: int = 10):
+        self.min_interval = 60.0 / calls_per_minute
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self._lock = anyio.Lock()
+
+    async def acquire(self) -> None:
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) / self.min_interval)
+                self.last = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) * self.min_interval
+            await anyio.sleep(wait)
+
 
 def _parse_market_cap(value: str) -> Optional[float]:
     """
@@ -25,26 +60,25 @@ def _parse_market_cap(value: str) -> Optional[float]:
     if value is None:
         return None
     s = str(value).strip()
-    if s == "" or s.lower() in ("nan", "none", "--"):
+    if s.lower() in _MC_SENTINELS:
         return None
 
-    m = re.match(r"^([0-9.]+)\s*(万亿|亿|万)?$", s)
-    if not m:
-        # 兜底：只取数字
+    for suffix, mul in _MC_UNITS:
+        if s.endswith(suffix):
+            try:
+                return float(s[: -len(suffix)]) * mul
+            except ValueError:
+                break
+    else:
         try:
-            return float(re.sub(r"[^0-9.]", "", s))
-        except Exception:
-            return None
-
-    num = float(m.group(1))
-    unit = m.group(2)
-    if unit == "万亿":
-        return num * 1e12
-    if unit == "亿":
-        return num * 1e8
-    if unit == "万":
-        return num * 1e4
-    return num
+            return float(s)
+        except ValueError:
+            pass
+    # 兜底：只取数字
+    try:
+        return float(_MC_STRIP_RE.sub("", s))
+    except Exception:
+        return None
 
 
 @dataclass
@@ -64,10 +98,16 @@ class MarketCapService:
     # DB 缓存有效期（天）：总市值日级更新足够（可按需调整）
     db_max_age_days: int = 1
     max_concurrency: int = 8
+    # 外部源调用频率上限（次/分钟）：AkShare 上游（东财）约 50 rpm 内安全
+    fetch_rpm: int = 50
 
     def __post_init__(self):
         self._cache: dict[str, tuple[float, Optional[float]]] = {}
         self._sem = anyio.Semaphore(self.max_concurrency)
+        self._bucket = _TokenBucket(calls_per_minute=self.fetch_rpm)
+        # 全市场快照的 single-flight 锁与上次快照时间：避免并发请求各自打快照接口
+        self._prime_lock = anyio.Lock()
+        self._last_prime = 0.0
 
     async def _get_exchange(self, code: str) -> Optional[str]:
         """获取股票的交易所前缀 (SH/SZ/BJ)"""
@@ -77,6 +117,98 @@ class MarketCapService:
         except Exception:
             return None
 
+    async def get_market_caps(self, codes: list[str]) -> dict[str, Optional[float]]:
+        """
+        批量获取总市值：内存缓存 -> DB 一次批量查询 -> 逐只外部兜底。
+        绝大多数请求在前两级命中，整页只需 1 次 DB 往返。
+        """
+        out: dict[str, Optional[float]] = {}
+        now = time.time()
+        missing: list[str] = []
+        for code in codes:
+            cached = self._cache.get(code)
+            if cached and (now - cached[0] <= self.ttl_seconds):
+                out[code] = cached[1]
+            else:
+                missing.append(code)
+        if not missing:
+            return out
+
+        try:
+            rows = await self.repo.get_latest_many(missing)
+        except Exception:
+            logger.exception("Failed to batch read market cap cache from DB, codes=%s", missing)
+            rows = {}
+
+        still: list[str] = []
+        for code in missing:
+            row = rows.get(code)
+            if row is not None and (date.today() - row.as_of_date).days <= self.db_max_age_days:
+                self._cache[code] = (time.time(), row.market_cap)
+                out[code] = row.market_cap
+            else:
+                still.append(code)
+
+        if still:
+            # 出现批量 miss 时先整市场快照一把（单次 HTTP 拿全部 A 股总市值），
+            # 比逐只打 stock_individual_info_em 快 2~3 个量级；失败不致命
+            await self._prime_if_stale()
+            now = time.time()
+            rest: list[str] = []
+            for code in still:
+                cached = self._cache.get(code)
+                if cached and (now - cached[0] <= self.ttl_seconds):
+                    out[code] = cached[1]
+                else:
+                    rest.append(code)
+            if rest:
+                caps = await asyncio.gather(*(self.get_market_cap(c) for c in rest))
+                out.update(zip(rest, caps))
+        return out
+
+    async def _prime_if_stale(self) -> None:
+        """single-flight：TTL 内只跑一次 prime_all，失败也记时间做退避。"""
+        if time.time() - self._last_prime <= self.ttl_seconds:
+            return
+        async with self._prime_lock:
+            if time.time() - self._last_prime <= self.ttl_seconds:
+                return
+            try:
+                n = await self.prime_all()
+                logger.info("Market cap snapshot primed, rows=%d", n)
+            except Exception:
+                logger.exception("Market cap snapshot prime failed")
+            finally:
+                self._last_prime = time.time()
+
+    async def prime_all(self) -> int:
+        """
+        东财全市场行情快照（ak.stock_zh_a_spot_em）一次拉全 A 股总市值，
+        批量写 DB 缓存并灌内存缓存。返回入缓存的股票数。
+        """
+        await self._bucket.acquire()
+        df = await anyio.to_thread.run_sync(ak.stock_zh_a_spot_em)
+        if df is None or df.empty or "代码" not in df.columns or "总市值" not in df.columns:
+            return 0
+
+        caps: dict[str, Optional[float]] = {}
+        for code, val in zip(df["代码"].astype(str).tolist(), df["总市值"].tolist()):
+            code = code.strip()
+            if len(code) == 6 and code.isdigit():
+                caps[code] = _parse_market_cap(val)
+        if not caps:
+            return 0
+
+        try:
+            await self.repo.bulk_upsert(list(caps.items()), as_of_date=date.today())
+        except Exception:
+            logger.exception("Failed to bulk upsert market cap snapshot")
+
+        now = time.time()
+        for code, cap in caps.items():
+            self._cache[code] = (now, cap)
+        return len(caps)
+
     async def get_market_cap(self, code: str) -> Optional[float]:
         now = time.time()
         cached = self._cache.get(code)
@@ -134,6 +266,7 @@ class MarketCapService:
                 return None
 
             try:
+                await self._bucket.acquire()
                 cap = await anyio.to_thread.run_sync(_fetch_sync)
             except Exception:
                 logger.exception("Failed to fetch market cap for code=%s", code)
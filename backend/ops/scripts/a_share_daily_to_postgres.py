@@ -21,19 +21,25 @@
   --limit      N          # 仅处理前 N 只股票（调试用）
   --sleep      SECONDS    # 每只股票请求后的休眠（默认 0s）
   --ts-rpm   N          # Tushare 每分钟调用次数限制（默认 50，设为 0 禁用限流）
+  --workers  N          # 并发拉取线程数（默认 16）
+  --rps      N          # 整体抓取速率上限（次/秒，默认 8）
 """
 
 from __future__ import annotations
 
 import argparse
 import getpass
+import io
 import os
+import re
 import sys
 import threading
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from datetime import date, timedelta
+from itertools import repeat
 from typing import Optional
 
 import akshare as ak
@@ -227,39 +233,35 @@ def ensure_tables(conn) -> None:
             """
         )
 
-        # 若表已存在但缺列（历史遗留），补齐列（你已删表则不会走到这里，但保留迁移兼容）
-        cur.execute(
-            """
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_schema='public' AND table_name='stock_daily';
-            """
-        )
-        cols = {r[0] for r in cur.fetchall()}
-        add_cols = {
-            "amplitude": "NUMERIC(10, 4)",
-            "pct_change": "NUMERIC(10, 4)",
-            "change_amount": "NUMERIC(18, 4)",
-            "turnover_rate": "NUMERIC(10, 4)",
-        }
-        for c, t in add_cols.items():
-            if c not in cols:
-                cur.execute(f'ALTER TABLE stock_daily ADD COLUMN {c} {t};')
+        # 若表已存在但缺列（历史遗留），补齐列（你已删表则不会走到这里，但保留迁移兼容）。
+        # ADD COLUMN IF NOT EXISTS 服务端幂等，省掉 information_schema.columns
+        # 这个跨 schema 的目录视图扫描和逐列往返
+        cur.execute('ALTER TABLE stock_daily ADD COLUMN IF NOT EXISTS amplitude NUMERIC(10, 4);')
+        cur.execute('ALTER TABLE stock_daily ADD COLUMN IF NOT EXISTS pct_change NUMERIC(10, 4);')
+        cur.execute('ALTER TABLE stock_daily ADD COLUMN IF NOT EXISTS change_amount NUMERIC(18, 4);')
+        cur.execute('ALTER TABLE stock_daily ADD COLUMN IF NOT EXISTS turnover_rate NUMERIC(10, 4);')
 
         cur.execute("CREATE INDEX IF NOT EXISTS idx_stock_daily_trade_date ON stock_daily(trade_date);")
     conn.commit()
     print("[OK] 数据表已就绪: stock_basic, stock_daily")
 
 
+# 交易所推断查表：两字符前缀（90 沪深 B / 92 北证）优先，其余按首字符分派。
+# 单次 dict 查找替代链式 startswith 的多次分支
+_EX_BY_PREFIX2 = {"90": "SZ", "92": "BJ"}
+_EX_BY_PREFIX1 = {"6": "SH", "0": "SZ", "3": "SZ", "8": "BJ", "4": "BJ"}
+
+
 def infer_exchange(code: str) -> str:
-    if code.startswith("6"):
-        return "SH"
-    if code.startswith(("0", "3", "90")):
-        return "SZ"
-    if code.startswith(("92", "8", "4")):
-        return "BJ"
-    # 兜底：按常见规则不应该出现
-    return "NA"
+    if not code:
+        return "NA"
+    return _EX_BY_PREFIX2.get(code[:2]) or _EX_BY_PREFIX1.get(code[0], "NA")
+
+
+def _infer_exchange_series(codes: pd.Series) -> pd.Series:
+    """infer_exchange 的向量化版：整列 map 查表，替代逐行 apply。"""
+    ex = codes.str[:2].map(_EX_BY_PREFIX2)
+    return ex.fillna(codes.str[0].map(_EX_BY_PREFIX1)).fillna("NA")
 
 
 def to_ak_symbol(code: str, exchange: str) -> str:
@@ -273,6 +275,10 @@ def to_ak_symbol(code: str, exchange: str) -> str:
     raise ValueError(f"无法生成 ak symbol: code={code}, exchange={exchange}")
 
 
+# 带交易所前缀的 symbol 形如 sh600000 / sz000001 / bj430047
+_AK_SYMBOL_RE = re.compile(r"^(sh|sz|bj)\d{6}$")
+
+
 def get_all_a_stocks() -> pd.DataFrame:
     """
     返回列：code, name, exchange
@@ -286,8 +292,7 @@ def get_all_a_stocks() -> pd.DataFrame:
         name_col = "名称" if "名称" in df.columns else ("name" if "name" in df.columns else None)
         if code_col and name_col:
             sym = df[code_col].astype(str).str.lower()
-            # 期望形如 sh600000 / sz000001 / bj430047
-            if sym.str.match(r"^(sh|sz|bj)\d{6}$").any():
+            if sym.str.match(_AK_SYMBOL_RE).any():
                 out = pd.DataFrame(
                     {
                         "code": sym.str[-6:],
@@ -311,7 +316,7 @@ def get_all_a_stocks() -> pd.DataFrame:
                     "name": df[name_col].astype(str),
                 }
             )
-            out["exchange"] = out["code"].apply(infer_exchange)
+            out["exchange"] = _infer_exchange_series(out["code"])
             out = out[out["exchange"] != "NA"].copy()
             # spot_em 偶尔会返回不完整数据；过小则视为失败，进入兜底
             if len(out) >= 1000:
@@ -324,7 +329,7 @@ def get_all_a_stocks() -> pd.DataFrame:
     df = ak.stock_info_a_code_name()
     df = df.rename(columns={"code": "code", "name": "name"})
     df["code"] = df["code"].astype(str).str.zfill(6)
-    df["exchange"] = df["code"].apply(infer_exchange)
+    df["exchange"] = _infer_exchange_series(df["code"])
     df = df[df["exchange"] != "NA"].copy()
     return df.drop_duplicates(subset=["code"], keep="last").reset_index(drop=True)[["code", "name", "exchange"]]
 
@@ -491,31 +496,38 @@ def fetch_daily(code: str, exchange: str, start_date: str, end_date: str, adjust
     raise RuntimeError(f"拉取失败 {code}({exchange}) daily: {last_err}")
 
 
+def _nullable_col(df: pd.DataFrame, name: str) -> list:
+    """按列抽取并把 NaN/NA 统一换成 None；列缺失时整列补 None。"""
+    if name not in df.columns:
+        return [None] * len(df)
+    return df[name].astype(object).where(df[name].notna(), None).tolist()
+
+
 def upsert_stock_daily(conn, code: str, daily_df: pd.DataFrame, adjust: str) -> int:
     if daily_df is None or daily_df.empty:
         return 0
 
-    rows = []
-    for r in daily_df.itertuples(index=False):
-        # 某些字段可能不存在，使用 getattr 兜底
-        rows.append(
-            (
-                code,
-                getattr(r, "trade_date", None),
-                getattr(r, "open", None),
-                getattr(r, "high", None),
-                getattr(r, "low", None),
-                getattr(r, "close", None),
-                int(getattr(r, "volume")) if getattr(r, "volume", None) is not None and pd.notna(
-                    getattr(r, "volume")) else None,
-                getattr(r, "amount", None),
-                getattr(r, "amplitude", None),
-                getattr(r, "pct_change", None),
-                getattr(r, "change_amount", None),
-                getattr(r, "turnover_rate", None),
-                adjust if adjust is not None else "",
-            )
+    # 按列构造（替代 itertuples 逐行 getattr + pd.notna）：
+    # tolist() 一次性拆箱整列，行数多时比逐行属性访问快一个量级
+    n = len(daily_df)
+    volume = [int(v) if v is not None else None for v in _nullable_col(daily_df, "volume")]
+    rows = list(
+        zip(
+            repeat(code, n),
+            _nullable_col(daily_df, "trade_date"),
+            _nullable_col(daily_df, "open"),
+            _nullable_col(daily_df, "high"),
+            _nullable_col(daily_df, "low"),
+            _nullable_col(daily_df, "close"),
+            volume,
+            _nullable_col(daily_df, "amount"),
+            _nullable_col(daily_df, "amplitude"),
+            _nullable_col(daily_df, "pct_change"),
+            _nullable_col(daily_df, "change_amount"),
+            _nullable_col(daily_df, "turnover_rate"),
+            repeat(adjust if adjust is not None else "", n),
         )
+    )
 
     with conn.cursor() as cur:
         psycopg2.extras.execute_values(
@@ -545,11 +557,79 @@ def upsert_stock_daily(conn, code: str, daily_df: pd.DataFrame, adjust: str) ->
     return len(rows)
 
 
+# --bulk-load 模式使用的列顺序（与 stock_daily 定义一致）
+_DAILY_COLS = (
+    "code", "trade_date", "open", "high", "low", "close", "volume", "amount",
+    "amplitude", "pct_change", "change_amount", "turnover_rate", "adjust",
+)
+
+
+def create_stage_table(conn) -> None:
+    # UNLOGGED：暂存表不写 WAL，初始回填期间落盘开销大幅降低；
+    # 崩溃会清空暂存数据，但回填本来就可以重跑
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS stock_daily_stage;")
+        cur.execute("CREATE UNLOGGED TABLE stock_daily_stage (LIKE stock_daily INCLUDING DEFAULTS);")
+    conn.commit()
+    print("[OK] 暂存表已就绪: stock_daily_stage (UNLOGGED)")
+
+
+def copy_stock_daily_stage(conn, code: str, daily_df: pd.DataFrame, adjust: str) -> int:
+    """
+    初始回填路径：COPY 进暂存表，绕开多值 INSERT 的逐行解析/冲突检查，
+    宽数值表上通常快 5~10 倍；最后由 merge_stage_into_stock_daily 一次合并。
+    """
+    if daily_df is None or daily_df.empty:
+        return 0
+    out = daily_df.copy()
+    out.insert(0, "code", code)
+    out["adjust"] = adjust if adjust is not None else ""
+    for c in _DAILY_COLS:
+        if c not in out.columns:
+            out[c] = None
+
+    buf = io.StringIO()
+    out[list(_DAILY_COLS)].to_csv(buf, index=False, header=False, na_rep="\\N")
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(
+            f"COPY stock_daily_stage({', '.join(_DAILY_COLS)}) FROM STDIN WITH (FORMAT CSV, NULL '\\N')",
+            buf,
+        )
+    conn.commit()
+    return len(out)
+
+
+def merge_stage_into_stock_daily(conn) -> None:
+    cols = ", ".join(_DAILY_COLS)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO stock_daily({cols})
+            SELECT {cols} FROM stock_daily_stage
+            ON CONFLICT (code, trade_date, adjust) DO UPDATE SET
+              open = EXCLUDED.open,
+              high = EXCLUDED.high,
+              low  = EXCLUDED.low,
+              close= EXCLUDED.close,
+              volume = EXCLUDED.volume,
+              amount = EXCLUDED.amount,
+              amplitude = EXCLUDED.amplitude,
+              pct_change = EXCLUDED.pct_change,
+              change_amount = EXCLUDED.change_amount,
+              turnover_rate = EXCLUDED.turnover_rate;
+            """
+        )
+        cur.execute("DROP TABLE stock_daily_stage;")
+    conn.commit()
+    print("[OK] 暂存表已合并入 stock_daily 并删除")
+
+
 def yyyymmdd(d: date) -> str:
     return d.strftime("%Y%m%d")
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser()
     p.add_argument("--start-date", type=str, default=None, help="YYYYMMDD，默认：今天往前两年")
     p.add_argument("--end-date", type=str, default=None, help="YYYYMMDD，默认：今天")
@@ -557,14 +637,21 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--limit", type=int, default=0, help="仅处理前 N 只股票（调试用，0 表示全部）")
     p.add_argument("--sleep", type=float, default=0.0, help="每只股票拉取后的休眠秒数")
     p.add_argument("--ts-rpm", type=int, default=50, help="Tushare 每分钟调用次数限制（默认 50，0 表示禁用限流）")
+    p.add_argument("--workers", type=int, default=16, help="并发拉取线程数（默认 16，设为 1 退化为串行）")
+    p.add_argument("--rps", type=float, default=8.0, help="整体抓取速率上限（次/秒，默认 8，0 表示不限）")
     p.add_argument("--disable-proxy", action="store_true",
                    help="临时禁用 HTTP(S)_PROXY 等代理环境变量（某些网络会导致东财等源不可用）")
+    p.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="初始回填模式：COPY 进 UNLOGGED 暂存表，最后一次性合并入 stock_daily（大批量时快 5~10 倍）",
+    )
     p.add_argument(
         "--allow-small-universe",
         action="store_true",
         help="允许股票列表数量过少时继续（默认会认为网络/代理异常并报错；A股正常应>1000）",
     )
-    return p.parse_args()
+    return p.parse_args(argv)
 
 
 def maybe_disable_proxy(disable: bool) -> None:
@@ -585,8 +672,8 @@ def maybe_disable_proxy(disable: bool) -> None:
     print("[INFO] 已按 --disable-proxy 禁用代理环境变量")
 
 
-def main() -> int:
-    args = parse_args()
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
     cfg = load_pg_config()
 
     maybe_disable_proxy(args.disable_proxy)
@@ -631,26 +718,54 @@ def main() -> int:
 
         upsert_stock_basic(conn, stocks)
 
-        ok, fail, total_rows = 0, 0, 0
-        for idx, r in enumerate(stocks.itertuples(index=False), start=1):
-            code = str(r.code).zfill(6)
-            exchange = str(r.exchange).upper()
-            name = str(r.name)
+        if args.bulk_load:
+            create_stage_table(conn)
 
-            try:
-                df_daily = fetch_daily(code=code, exchange=exchange, start_date=start_date, end_date=end_date,
-                                       adjust=adjust)
-                n = upsert_stock_daily(conn, code=code, daily_df=df_daily, adjust=adjust)
-                total_rows += n
-                ok += 1
-                if idx % 50 == 0 or idx == len(stocks):
-                    print(f"[PROGRESS] {idx}/{len(stocks)} OK={ok} FAIL={fail} 累计写入行数={total_rows}")
-            except Exception as e:
-                fail += 1
-                print(f"[ERROR] {idx}/{len(stocks)} {code} {name} {exchange} 拉取/写入失败: {e}", file=sys.stderr)
+        # 抓取是网络密集型：线程池并发拉取，全局令牌桶约束整体速率，
+        # 避免打爆数据源；DB 写入仍在主线程按完成顺序进行
+        # （psycopg2 连接不能跨线程共享事务）
+        fetch_limiter = (
+            TushareRateLimiter(calls_per_minute=max(1, int(args.rps * 60)), burst=max(1, args.workers))
+            if args.rps > 0
+            else None
+        )
 
+        def _fetch_one(code: str, exchange: str) -> pd.DataFrame:
+            if fetch_limiter is not None and not fetch_limiter.acquire(timeout=120.0):
+                raise RuntimeError("整体抓取限流等待超时")
+            df = fetch_daily(code=code, exchange=exchange, start_date=start_date, end_date=end_date, adjust=adjust)
             if args.sleep and args.sleep > 0:
                 time.sleep(args.sleep)
+            return df
+
+        meta = [
+            (str(r.code).zfill(6), str(r.exchange).upper(), str(r.name))
+            for r in stocks.itertuples(index=False)
+        ]
+        ok, fail, total_rows = 0, 0, 0
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = {
+                pool.submit(_fetch_one, code, exchange): (code, exchange, name)
+                for code, exchange, name in meta
+            }
+            for idx, fut in enumerate(as_completed(futures), start=1):
+                code, exchange, name = futures[fut]
+                try:
+                    df_daily = fut.result()
+                    if args.bulk_load:
+                        n = copy_stock_daily_stage(conn, code=code, daily_df=df_daily, adjust=adjust)
+                    else:
+                        n = upsert_stock_daily(conn, code=code, daily_df=df_daily, adjust=adjust)
+                    total_rows += n
+                    ok += 1
+                    if idx % 50 == 0 or idx == len(meta):
+                        print(f"[PROGRESS] {idx}/{len(meta)} OK={ok} FAIL={fail} 累计写入行数={total_rows}")
+                except Exception as e:
+                    fail += 1
+                    print(f"[ERROR] {idx}/{len(meta)} {code} {name} {exchange} 拉取/写入失败: {e}", file=sys.stderr)
+
+        if args.bulk_load:
+            merge_stage_into_stock_daily(conn)
 
         print(f"[DONE] 完成：OK={ok} FAIL={fail} 写入行数={total_rows}")
         return 0 if fail == 0 else 2
@@ -323,18 +323,18 @@ def yyyymmdd(d: date) -> str:
     return d.strftime("%Y%m%d")
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser()
     p.add_argument("--start-date", type=str, default=None, help="YYYYMMDD，默认：今天往前两年")
     p.add_argument("--end-date", type=str, default=None, help="YYYYMMDD，默认：今天")
     p.add_argument("--adjust", type=str, default="qfq", help='复权类型：""|qfq|hfq（默认 qfq）')
     p.add_argument("--limit", type=int, default=0, help="仅处理前 N 只股票（调试用，0 表示全部）")
     p.add_argument("--sleep", type=float, default=0.0, help="每只股票拉取后的休眠秒数")
-    return p.parse_args()
+    return p.parse_args(argv)
 
 
-def main() -> int:
-    args = parse_args()
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
     cfg = load_pg_config()
 
     today = date.today()
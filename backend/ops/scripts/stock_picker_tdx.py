@@ -43,6 +43,11 @@ import psycopg2
 import psycopg2.extras
 import psycopg2.sql
 
+# 结果表 DDL 的 advisory 锁键：流水线并发跑多个策略时，每个 picker 都会对
+# 同一张当日结果表执行 CREATE/DROP IF NOT EXISTS——该类 DDL 并不并发安全，
+# 落败会话会撞 pg_type 唯一键报错。固定键值在所有 picker 进程/连接间一致即可
+_DDL_LOCK_KEY = 0x68715F70696B  # "hq_pik"
+
 
 def find_repo_root() -> Path:
     """
@@ -106,6 +111,10 @@ def ensure_result_table(conn, table_name: str) -> None:
     idx_code = f"idx_spr_{suffix}_code"
 
     with conn.cursor() as cur:
+        # 事务级 advisory 锁串行化建表：并发 picker 同时首建当日表时，
+        # IF NOT EXISTS 的落败会话会报 pg_type 唯一键冲突；持锁方 commit 后
+        # 等锁方再执行时表已可见，IF NOT EXISTS 才真正生效。锁随 commit 释放
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (_DDL_LOCK_KEY,))
         cur.execute(
             psycopg2.sql.SQL(
                 """
@@ -605,6 +614,8 @@ def cleanup_old_result_tables(conn, prefix: str, retention_days: int) -> int:
     pattern = re.compile(re.escape(prefix) + r"(\d{8})$")
 
     with conn.cursor() as cur:
+        # 与 ensure_result_table 共用一把 DDL 锁：并发 DROP 同名表同样不安全
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (_DDL_LOCK_KEY,))
         cur.execute(
             """
             SELECT table_name
@@ -632,8 +643,9 @@ def cleanup_old_result_tables(conn, prefix: str, retention_days: int) -> int:
         for t in to_drop:
             cur.execute(psycopg2.sql.SQL("DROP TABLE IF EXISTS {t};").format(t=psycopg2.sql.Identifier(t)))
 
-    if to_drop:
-        conn.commit()
+    # 无论删没删都提交：advisory 锁随事务持有，拖到后续 commit 才释放
+    # 会把其它策略的建表/清理串行卡在整个选股过程之后
+    conn.commit()
     return len(to_drop)
 
 
@@ -657,7 +669,7 @@ def build_metrics_en(vars_: Dict[str, Value]) -> Dict[str, Optional[float]]:
     return out
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser()
     p.add_argument(
         "--rule",
@@ -678,11 +690,11 @@ def parse_args() -> argparse.Namespace:
     )
     p.add_argument("--retention-days", type=int, default=30, help="结果分表保留天数，默认 30 天；到期自动删表")
     p.add_argument("--disable-cleanup", action="store_true", help="禁用过期结果表清理")
-    return p.parse_args()
+    return p.parse_args(argv)
 
 
-def main() -> int:
-    args = parse_args()
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
     cfg = load_pg_config()
 
     repo_root = find_repo_root()
@@ -11,9 +11,9 @@ if str(_ROOT) not in sys.path:
     sys.path.insert(0, str(_ROOT))
 
 from backend.app.core.config import settings
-from backend.app.core.logging import configure_logging, get_logger
+from backend.app.core.logging import configure_logging, get_logger, stop_logging_listener
 from backend.app.db.database import Database, DbConfig
-from backend.app.jobs.scheduler import start_scheduler
+from backend.app.jobs.scheduler import start_scheduler, stop_scheduler
 from backend.app.repos.indicators_repo import IndicatorsRepo
 from backend.app.repos.market_cap_repo import MarketCapRepo
 from backend.app.services.market_cap import MarketCapService
@@ -44,20 +44,28 @@ async def app_context():
         )
     )
     await db.connect()
+    # ensure_once：和 API 进程共用同一把 schema 锁；探测对象取 ensure_schema
+    # 里最新加入的 DDL，避免存量库因旧表已存在而跳过增量 DDL
+    schema_lock_key = int(settings.scheduler_lock_key) + 2
+    ind_repo = IndicatorsRepo(db)
+    await db.ensure_once(
+        "public.idx_stock_weekly_code_adjust_date", ind_repo.ensure_schema, lock_key=schema_lock_key
+    )
     mc_repo = MarketCapRepo(db)
-    await mc_repo.ensure_schema()
+    await db.ensure_once(
+        "public.stock_market_cap_latest", mc_repo.ensure_schema, lock_key=schema_lock_key
+    )
     _ = MarketCapService(repo=mc_repo)  # 确保导入可用（worker 里不直接用）
-    ind_repo = IndicatorsRepo(db)
-    await ind_repo.ensure_schema()
     try:
         yield db
     finally:
         await db.close()
+        stop_logging_listener()
 
 
 async def main() -> None:
     async with app_context() as db:
-        scheduler = start_scheduler(db)
+        scheduler = await start_scheduler(db)
         logger.info("Worker running. db=%s", settings.pg_db)
         # 永久运行
         try:
@@ -66,10 +74,22 @@ async def main() -> None:
         except asyncio.CancelledError:
             # 允许优雅退出（例如 Ctrl+C / SIGTERM）
             logger.info("Worker cancelled, shutting down.")
-            return
+        finally:
+            if scheduler.running:
+                scheduler.shutdown(wait=False)
+            # 守护锁连接先归还，db.close()（app_context 的 finally）才不会卡死
+            await stop_scheduler(db)
 
 
 if __name__ == "__main__":
+    # uvloop：Linux 上事件循环调度明显更快（DB/子进程 I/O 全部受益）；
+    # 未安装（如 Windows 开发机）时保持默认 asyncio 循环
+    try:
+        import uvloop
+
+        uvloop.install()
+    except ImportError:
+        pass
     try:
         asyncio.run(main())
     except KeyboardInterrupt: